@@ -5,39 +5,168 @@ import argparse
 # import fileinput
 import random
 import sys
-import torch
+from collections import deque
+from multiprocessing import Pool
 
 from tqdm import tqdm
 
+from compressed import compression, open_text, output_path
+from corpus import Corpus, line_blocks, input_size
+from noise import NoisePipeline, OPERATORS, parse_operator, default_operators, random_seed
+
 #cat monolingual.de | python $BPEROOT/apply_bpe.py -c code | python interactive.py $DATA --path model.pt --buffer-size 1024 --beam 5 --batch-size 16 |grep -P '^H' |cut -f3- | sed 's/@@\s*//g' | python addnoise.py > translation.en
+#
+# 输入边读边处理 (见 corpus.line_blocks)，内存与输入大小无关；每处理完一块就整块写出并 flush，下游马上能拿到
+#
+# --copies K: 每句只读、切词一次，生成 K 份独立加噪的结果，第 k 份的种子是 --seed + k，和单独用这个种子运行的输出相同。
+# 给了 --output PREFIX 时第 k 份写进 PREFIX.k (PREFIX 以 .gz / .zst 结尾时压缩，如 n.ja.gz -> n.ja.0.gz)，
+# 否则交错写到标准输出: 每句输入连续 K 行，依次是第 0 到 K - 1 份
+
+_worker = None
+
+
+def _init_worker(path, pipeline, seeds):
+    # path: 输入文件时每个子进程自己映射它，按行号区间读取，句子不必经过进程间传递；seeds: 每份结果的种子
+    global _worker
+    _worker = (Corpus(path) if path else None, pipeline, seeds)
+
+
+def _noise_task(task):
+    # task: (起始行号, 这一块的句子) 或 (起始行号, 结束行号)
+    # 返回每个种子加噪后的句子列表
+    corpus, pipeline, seeds = _worker
+    start, lines = task
+    if isinstance(lines, int):
+        lines = list(corpus.lines(start, lines, keepends=False))
+    return pipeline.variants(lines, seeds, start)
+
+
+def numbered(blocks, size):
+    # 读到的块切成不超过 size 行的块，附上第一行的行号
+    start = 0
+    for block in blocks:
+        for lo in range(0, len(block), size):
+            yield start + lo, block[lo:lo + size]
+        start += len(block)
+
+
+def ordered_imap(pool, func, tasks, limit):
+    # 和 pool.imap 一样按提交顺序给出结果，但最多 limit 个任务在途，读得比处理快时内存不会增长
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= limit:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def write_block(lines):
+    if lines:
+        sys.stdout.buffer.write(('\n'.join(lines) + '\n').encode('utf8'))
+        sys.stdout.buffer.flush()
+
 
 def main():
     parser = argparse.ArgumentParser(description='Command-line script to add noise to data')
     parser.add_argument('-wd', help='Word dropout', default=0.1, type=float)
     parser.add_argument('-wb', help='Word blank', default=0.1, type=float)
     parser.add_argument('-sk', help='Shuffle k words', default=3, type=int)
+    parser.add_argument('--input', default=None, help='read this file (memory-mapped or decompressed in the background, see corpus.py) instead of stdin')
+    parser.add_argument('--engine', choices=('numpy', 'torch'), default='numpy',
+                        help='numpy: noise a block of sentences at once (see noise.py), torch: the original per-sentence torch calls')
+    parser.add_argument('--noise', nargs='+', default=None, metavar='OP[:KEY=VALUE,...]',
+                        help='noise operators applied in this order by the numpy engine, one of %s, '
+                             'e.g. --noise char_swap:p=0.05 span_mask:p=0.03,mean=3 insert:p=0.05,vocab=vocab.txt bpe_dropout:p=0.1 '
+                             '(see noise.py), default shuffle:k=SK dropout:p=WD blank:p=WB' % ', '.join(OPERATORS))
+    parser.add_argument('--block_size', type=int, default=10000, help='at most this many sentences are noised at once by the numpy engine')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='derive the random numbers of every line from this seed and the line number, the same seed always gives the same output')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes noising blocks of lines, output is identical to a single process run with the same --seed')
+    parser.add_argument('--copies', type=int, default=1,
+                        help='noise every sentence this many times with seeds --seed, --seed + 1, ..., reading and splitting it only once')
+    parser.add_argument('--output', default=None, metavar='PREFIX',
+                        help='write copy k to PREFIX.k (compressed if PREFIX ends with .gz or .zst), '
+                             'default: stdout, the copies of each sentence on consecutive lines')
     args = parser.parse_args()
     wd = args.wd
     wb = args.wb
     sk = args.sk
+    if args.engine == 'torch' and (args.seed is not None or args.workers > 1 or args.noise or args.copies > 1 or args.output):
+        parser.error('--seed, --workers, --noise, --copies and --output need the numpy engine')
+    if args.copies < 1:
+        parser.error('--copies must be at least 1')
+
+    if args.engine == 'numpy':
+        # 先检查算子 (含 insert 的词表文件)，出错时在进度条出现之前报告
+        try:
+            operators = [parse_operator(spec) for spec in args.noise] if args.noise else default_operators(sk, wd, wb)
+        except (ValueError, TypeError, OSError) as e:
+            parser.error(str(e))
+
+    bar = tqdm(total=input_size(args.input), unit='B', unit_scale=True, mininterval=0.5, ncols=70)
+    if args.engine == 'torch':
+        # for s in fileinput.input('-'):
+        for block in line_blocks(args.input, bar):
+            write_block([torch_noise(s, sk, wd, wb) for s in block])
+        bar.close()
+        return
+
+    pipeline = NoisePipeline(operators)
+    seed = random_seed() if args.seed is None else args.seed
+    seeds = [(seed + k) & 0xFFFFFFFFFFFFFFFF for k in range(args.copies)]
+    # 多进程读输入文件时子进程按行号区间直接读，否则由主进程边读边分块
+    by_range = args.workers > 1 and args.input is not None and not compression(args.input)
+    if by_range:
+        corpus = Corpus(args.input)
+        tasks = [(lo, min(lo + args.block_size, len(corpus))) for lo in range(0, len(corpus), args.block_size)]
+    else:
+        tasks = numbered(line_blocks(args.input, bar), args.block_size)
+    pool = None
+    if args.workers > 1:
+        pool = Pool(args.workers, initializer=_init_worker, initargs=(args.input if by_range else None, pipeline, seeds))
+        outs = ordered_imap(pool, _noise_task, tasks, 2 * args.workers)
+    else:
+        _init_worker(None, pipeline, seeds)
+        outs = map(_noise_task, tasks)
+    files = [open_text(output_path(args.output, '.%i' % k), 'w') for k in range(args.copies)] if args.output else None
+    for k, variants in enumerate(outs):
+        if files:
+            for f, out in zip(files, variants):
+                if out:
+                    f.write('\n'.join(out) + '\n')
+        else:
+            # 交错: 第 i 句的 K 份依次相邻
+            write_block([s for group in zip(*variants) for s in group])
+        if by_range:
+            lo, hi = tasks[k]
+            bar.update(int(corpus.offsets[hi] - corpus.offsets[lo]))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    for f in files or ():
+        f.close()
+    bar.close()
 
-    # for s in fileinput.input('-'):
-    for s in tqdm(sys.stdin.read().split('\n'), mininterval=0.5, ncols=50):
-        s = s.strip().split()
-        if len(s) > 0:
-            s = word_shuffle(s, sk)
-            s = word_dropout(s, wd)
-            s = word_blank(s, wb)
-        print(' '.join(s))
 
+def torch_noise(s, sk, wd, wb):
+    s = s.strip().split()
+    if len(s) > 0:
+        s = word_shuffle(s, sk)
+        s = word_dropout(s, wd)
+        s = word_blank(s, wb)
+    return ' '.join(s)
 
 
 def word_shuffle(s, sk):
+    import torch
     noise = torch.rand(len(s)).mul_(sk)
     perm = torch.arange(len(s)).float().add_(noise).sort()[1]
     return [s[i] for i in perm]
 
 def word_dropout(s, wd):
+    import torch
     keep = torch.rand(len(s))
     res = [si for i,si in enumerate(s) if keep[i] > wd ]
     if len(res) == 0:
@@ -45,6 +174,7 @@ def word_dropout(s, wd):
     return res
 
 def word_blank(s, wb):
+    import torch
     keep = torch.rand(len(s))
     return [si if keep[i] > wb else 'Ж' for i,si in enumerate(s)]
 
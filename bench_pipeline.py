@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 清洗脚本的端到端基准: 用 synth_corpus.py 生成不同规模的合成语料，跑 preprocess.py (或 --mono 时 preprocess_mono.py)，
+# 记录整个流程和每条规则的耗时、吞吐量 (lines/s) 以及峰值内存，并可与保存下来的基线比较。
+#
+#   python bench_pipeline.py --sizes 10K 1M --save bench_baseline.json          # 记录基线
+#   python bench_pipeline.py --sizes 10K 1M --baseline bench_baseline.json      # 之后与基线比较
+#   python bench_pipeline.py --sizes 1M --args="--stream --workers 4"          # 脚本的额外参数
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from synth_corpus import DEFAULT_NOISE, load_seed_pairs, parse_noise, parse_size, write_corpus
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def corpus_prefix(data_dir, size, noise, seed):
+    # 同样的规模、噪声和种子只生成一次
+    tag = ','.join('%s=%g' % (k, noise[k]) for k in sorted(noise) if noise[k] != DEFAULT_NOISE.get(k))
+    name = '%s.seed%i%s' % (size, seed, '.' + tag if tag else '')
+    return os.path.join(data_dir, name)
+
+
+def run_script(cmd):
+    # 返回 (墙钟秒数, 子进程的峰值内存 KB)
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError('%s exited with status %i' % (' '.join(cmd), os.waitstatus_to_exitcode(status)))
+    return seconds, rusage.ru_maxrss
+
+
+def bench(size, args, pairs, noise):
+    lines = parse_size(size)
+    prefix = corpus_prefix(args.data_dir, size, noise, args.seed)
+    if not (os.path.exists(prefix + '.zh') and os.path.exists(prefix + '.ja')):
+        print('generating %s ...' % prefix, file=sys.stderr)
+        write_corpus(prefix, pairs, lines, noise, args.seed)
+
+    stats = prefix + '.stats.json'
+    if args.mono:
+        cmd = [sys.executable, os.path.join(HERE, 'preprocess_mono.py'), prefix + '.ja', 'ja']
+    else:
+        cmd = [sys.executable, os.path.join(HERE, 'preprocess.py'), prefix + '.zh', prefix + '.ja']
+    cmd += ['--stats', stats] + shlex.split(args.args)
+    # 重复几次取最快的一次，减少机器负载带来的抖动
+    best = None
+    for _ in range(args.repeat):
+        seconds, rss = run_script(cmd)
+        with open(stats, encoding='utf8') as f:
+            rows = json.load(f)
+        if best is None or seconds < best[0]:
+            best = seconds, rss, rows
+    seconds, rss, rows = best
+    return {
+        'lines': lines,
+        'seconds': round(seconds, 3),
+        'lines_per_s': round(lines / seconds, 1),
+        'peak_rss_kb': rss,
+        'rules': {row['rule']: {'seconds': row['seconds'], 'lines_per_s': row['lines_per_s'],
+                                'peak_rss_delta_kb': row['peak_rss_delta_kb']}
+                  for row in rows if row['rule'] != 'total'},
+    }
+
+
+def compare(results, baseline, threshold):
+    # 吞吐量按 当前 / 基线 给出倍数，低于 1 - threshold 的标记为变慢
+    print('%-6s %-22s %12s %12s %8s' % ('size', 'stage', 'baseline', 'current', 'change'))
+    regressions = 0
+    for size, cur in results.items():
+        old = baseline.get(size)
+        if old is None:
+            continue
+        rows = [('pipeline lines/s', old['lines_per_s'], cur['lines_per_s']),
+                ('peak rss MB', old['peak_rss_kb'] / 1024, cur['peak_rss_kb'] / 1024)]
+        for rule, stat in cur['rules'].items():
+            if rule in old['rules'] and stat['lines_per_s'] and old['rules'][rule]['lines_per_s']:
+                rows.append((rule, old['rules'][rule]['lines_per_s'], stat['lines_per_s']))
+        for name, a, b in rows:
+            change = b / a if a else float('nan')
+            # 内存是越小越好，其余越大越好
+            worse = change > 1 + threshold if name == 'peak rss MB' else change < 1 - threshold
+            regressions += worse
+            print('%-6s %-22s %12.1f %12.1f %7.2fx%s' % (size, name, a, b, change, '  <- regression' if worse else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', default=['10K', '1M', '10M'], help='corpus sizes to benchmark')
+    parser.add_argument('--noise', default=None, help='noise mix passed to synth_corpus.py, e.g. html=0.05,dup=0.4')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the synthetic corpora')
+    parser.add_argument('--data_dir', default='bench_data', help='where the synthetic corpora and outputs are kept')
+    parser.add_argument('--mono', action='store_true', default=False,
+                        help='benchmark preprocess_mono.py on the japanese side instead of preprocess.py')
+    parser.add_argument('--args', default='', help='extra arguments for the cleaning script, e.g. "--stream --workers 4"')
+    parser.add_argument('--repeat', type=int, default=1, help='run every size this many times and keep the fastest run')
+    parser.add_argument('--save', default=None, help='save the results as a baseline to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare the results with this baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change that counts as a regression when comparing with the baseline')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    pairs = load_seed_pairs(os.path.join(HERE, 'valid/valid.raw.zh'), os.path.join(HERE, 'valid/valid.raw.ja'))
+    noise = parse_noise(args.noise)
+
+    results = {}
+    for size in args.sizes:
+        results[size] = bench(size, args, pairs, noise)
+        r = results[size]
+        print('%-6s %10i lines %9.2fs %10.1f lines/s %8.1f MB' % (size, r['lines'], r['seconds'], r['lines_per_s'],
+                                                                    r['peak_rss_kb'] / 1024))
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as f:
+            baseline = json.load(f)
+        if baseline.get('args') != args.args or baseline.get('mono') != args.mono:
+            print('warning: baseline was recorded with different script arguments', file=sys.stderr)
+        if compare(results, baseline['results'], args.threshold):
+            sys.exit(1)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf8') as f:
+            json.dump({'args': args.args, 'mono': args.mono, 'noise': noise, 'seed': args.seed, 'results': results},
+                      f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 规则的微基准: 对比原先每句调用 re.findall (字符串形式的正则) 的写法和 clean_rules 里预编译 / 整块向量化的写法，
+# 同时检查两者的判定完全一致。
+#
+# 计数类规则 (*) 共用一遍扫描得到的字符统计特征 (见 features.py)，规则整块执行 (Rule.batch)。单独跑一条规则时
+# 这遍扫描的开销全算在它头上，所以另外给出扫描本身的耗时，以及这几条规则按 preprocess.py 的顺序连在一起时的总耗时。
+#
+#   python bench_rules.py valid/valid.raw.zh valid/valid.raw.ja --repeat 5
+
+import argparse
+import re
+import timeit
+from string import punctuation
+
+import clean_rules as cr
+import features
+
+
+# 原先 preprocess.py 里各个规则对单句 / 句子对的判定，返回 True 表示保留
+def legacy_sp_punc(x, y):
+    def hot_fix_filter(sent):
+        if sent.count("/") > 5:
+            return False
+        if sent.count("|") > 5:
+            return False
+        if sent.count("-") > 5:
+            return False
+        if len(re.findall(r"[\d\-\|/]", sent)) / len(sent) > 0.5:
+            return False
+        return True
+    return hot_fix_filter(x) and hot_fix_filter(y)
+
+
+def legacy_punc_ratio(x, y):
+    count_func = lambda l1, l2: sum([1 for x in l1 if x in l2])
+    punctuation_set = set(punctuation)
+    m_punc_x = count_func(x, set(punctuation_set))
+    m_punc_y = count_func(y, set(punctuation_set))
+    return not (m_punc_x / (len(x) + 1e-9) > 0.5 or m_punc_y / (len(y) + 1e-9) > 0.5
+                or m_punc_x > 10 or m_punc_y > 10)
+
+
+def legacy_numalp_ratio(x, y):
+    return not (re.findall(r"\d{8}", x) or re.findall(r"\d{8}", y)
+                or re.findall(r"[A-Za-z0-9]{15}", x) or re.findall(r"[A-Za-z0-9]{15}", y)
+                or len(re.findall(r"[A-Za-z0-9]{1}", x)) / len(x) > 0.5
+                or len(re.findall(r"[A-Za-z0-9]{1}", y)) / len(y) > 0.5)
+
+
+def legacy_st_numalp_ratio(x, y):
+    pm_x = len(re.findall(r"[A-Za-z0-9]", x))
+    pm_y = len(re.findall(r"[A-Za-z0-9]", y))
+    return not (pm_x / (pm_y + 1e-9) > 2 or pm_y / (pm_x + 1e-9) > 2)
+
+
+def legacy_html(x, y):
+    def filter_by_html(sentence):
+        detector = re.compile('<.*?>')
+        html_tag = re.findall(detector, sentence)
+        if html_tag or 'https://' in sentence or 'http://' in sentence:
+            return False
+        return True
+    return filter_by_html(x) or filter_by_html(y)
+
+
+def legacy_x(x, y):
+    return not (re.findall(r"[0-9]{3,4}x[0-9]{3,4}", x) or re.findall(r"[0-9]{3,4}x[0-9]{3,4}", y))
+
+
+def legacy_nonzhja_ratio(x, y):
+    return not (len(re.findall("[一-龥]", x)) / len(x) < 0.5
+                or len(re.findall(u"[ぁ-んァ-ン一-龥]", y)) / len(y) < 0.5)
+
+
+def legacy_emoji(x, y):
+    emoj = re.compile("["
+                      u"\U0001F600-\U0001F64F"  # emoticons
+                      u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+                      u"\U0001F680-\U0001F6FF"  # transport & map symbols
+                      u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+                      "]+", flags=re.UNICODE)
+    return not (re.findall(emoj, x) or re.findall(emoj, y))
+
+
+def legacy_ratio_rules(x, y):
+    return [legacy_sp_punc(x, y), legacy_punc_ratio(x, y), legacy_numalp_ratio(x, y),
+            legacy_st_numalp_ratio(x, y), legacy_nonzhja_ratio(x, y)]
+
+
+def each(legacy):
+    return lambda pairs: [legacy(x, y) for x, y in pairs]
+
+
+def wrap(rule):
+    # 整块判定；清掉特征缓存，让每次调用都包含特征的计算
+    def run(pairs):
+        features.clear_features()
+        return [out is not None for out in rule.batch(pairs)]
+    return run
+
+
+def new_ratio_rules(pairs):
+    features.clear_features()
+    outs = [[out is not None for out in rule.batch(pairs)] for rule in RATIO_RULES]
+    return [list(verdicts) for verdicts in zip(*outs)]
+
+
+def feature_scan(pairs):
+    return features.pair_features(pairs)
+
+
+RATIO_RULES = [cr.SpPuncRemove(), cr.PuncRatioRemove(), cr.NumAlpRatioRemove(), cr.StNumAlpRatioRemove(),
+               cr.ScriptRatioRemove((cr.ZH_CHARS, cr.JA_CHARS))]
+
+
+BENCHES = [
+    ('sp_punc_remove *', each(legacy_sp_punc), wrap(RATIO_RULES[0])),
+    ('punc_ratio_remove *', each(legacy_punc_ratio), wrap(RATIO_RULES[1])),
+    ('numalp_ratio_remove *', each(legacy_numalp_ratio), wrap(RATIO_RULES[2])),
+    ('st_numalp_ratio_remove *', each(legacy_st_numalp_ratio), wrap(RATIO_RULES[3])),
+    ('nonzhja_ratio_remove *', each(legacy_nonzhja_ratio), wrap(RATIO_RULES[4])),
+    ('html_remove', each(legacy_html), wrap(cr.HtmlRemove())),
+    ('x_remove', each(legacy_x), wrap(cr.XRemove())),
+    ('emoji_remove', each(legacy_emoji), wrap(cr.EmojiRemove())),
+    ('feature scan', None, feature_scan),
+    ('* rules chained', each(legacy_ratio_rules), new_ratio_rules),
+]
+
+
+# 在原句上加一些噪声，让每条规则都有机会被触发
+NOISE = ['{}', '<b>{}</b>', '{}http://example.com/a', '{}😀', '{}12345678', '{}abcdefghijklmnopqrstu',
+         '1920x1080{}', '{}//////', '{}!!!!!!!!!!!!', 'hello world {}', '{}-|-|-|-|', '１２３{}']
+
+
+def load_pairs(src, tgt, lines):
+    norm = cr.Norm()
+    pairs = []
+    with open(src, encoding='utf8') as f1, open(tgt, encoding='utf8') as f2:
+        for i, (x, y) in enumerate(zip(f1, f2)):
+            if i >= lines:
+                break
+            x, y = norm((NOISE[i % len(NOISE)].format(x.strip()), NOISE[i * 7 % len(NOISE)].format(y.strip())))
+            if x and y:
+                pairs.append((x, y))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', nargs='?', default='valid/valid.raw.zh', help='source file')
+    parser.add_argument('tgt', nargs='?', default='valid/valid.raw.ja', help='target file')
+    parser.add_argument('--lines', type=int, default=5000, help='number of pairs to benchmark on')
+    parser.add_argument('--repeat', type=int, default=5, help='take the best of this many runs')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.src, args.tgt, args.lines)
+
+    def best(fn):
+        return min(timeit.repeat(lambda: fn(pairs), number=1, repeat=args.repeat))
+
+    print('%i pairs, us per pair' % len(pairs))
+    print('%-26s %10s %10s %8s' % ('rule', 'legacy', 'compiled', 'speedup'))
+
+    for name, legacy, new in BENCHES:
+        t_new = best(new) / len(pairs) * 1e6
+        if legacy is None:
+            print('%-26s %10s %10.2f' % (name, '-', t_new))
+            continue
+        for (x, y), a, b in zip(pairs, legacy(pairs), new(pairs)):
+            assert a == b, (name, x, y)
+        t_old = best(legacy) / len(pairs) * 1e6
+        print('%-26s %10.2f %10.2f %7.2fx' % (name, t_old, t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
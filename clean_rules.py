@@ -0,0 +1,777 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 清洗规则与单遍过滤引擎
+#
+# 每条规则是一个可调用对象: 输入一组句子 (平行语料为 (src, tgt)，单语为 (sent,))，
+# 通过时返回 (可能被改写的) 句子组，被过滤时返回 None。
+# RuleChain 让每个句子对只规范化一次，然后按顺序流过所有规则，一旦被某条规则拒绝就立即停止。
+
+import re
+import sys
+from collections import deque
+from functools import lru_cache
+from multiprocessing import Pool
+
+import numpy as np
+
+from contamination import NgramIndex
+from dedup import HashSet, MinHashLSH, find_duplicates, pair_key
+from features import CHAR_CLASSES, features_of
+from instrument import RuleStats
+from langid_stage import LangidScorer
+from text_norm import norm
+
+
+# 预编译的正则，所有规则共用
+DIGIT8_RE = re.compile(r"\d{8}")
+NUMALP15_RE = re.compile(r"[A-Za-z0-9]{15}")
+RESOLUTION_RE = re.compile(r"[0-9]{3,4}x[0-9]{3,4}")
+HTML_TAG_RE = re.compile('<.*?>')
+# 软模式一遍扫描同时去掉标签、网址和 HTML 实体 (&amp; &#39; &#x3042; 等)。网址只由 ASCII 字符组成，规范化之后
+# 已经没有空格，遇到中日文字符即结束
+SOFT_HTML_RE = re.compile(r"</?[A-Za-z!][^<>]*>"
+                          r"|(?:https?://|www\.)[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]+"
+                          r"|&(?:[A-Za-z][A-Za-z0-9]{1,7}|#[0-9]{1,7}|#[xX][0-9A-Fa-f]{1,6});")
+EMOJI_RE = re.compile("["
+                      u"\U0001F600-\U0001F64F"  # emoticons
+                      u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+                      u"\U0001F680-\U0001F6FF"  # transport & map symbols
+                      u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+                      "]+", flags=re.UNICODE)
+
+
+# 单句的类别串 (见 features.py)，语种识别的捷径用它数假名
+@lru_cache(maxsize=8)
+def char_classes(sent):
+    return sent.translate(CHAR_CLASSES)
+
+
+ZH_CHARS = 'zh'         # [\u4e00-\u9fa5]
+JA_CHARS = 'ja'         # [ぁ-んァ-ン一-龥]
+
+
+class Rule(object):
+    # 在流程描述 (见 pipeline.py) 和垃圾箱 (见 trash_bin.py) 里使用的名字
+    name = None
+    # 日志模板，与原先各个 xxx_remove 函数打印的内容保持一致
+    msg = None
+    # 被该规则过滤掉的句子对是否放入垃圾箱 (见 preprocess_with_trash.py)
+    trash = False
+    # 依赖之前所有句子的规则 (如去重) 只能在主进程里按顺序执行，且不能改写句子
+    stateful = False
+    # 整批处理更快的规则 (如语种识别)，RuleChain 会把一块句子组中还存活的部分一次性交给 batch
+    batched = False
+    # 会改写句子的规则，调整规则顺序时不能越过它 (见 pipeline.reorder_rules)
+    rewrites = False
+    # 只统计、不过滤也不改写句子的规则 (如 flag 模式的 contamination_remove)，调整顺序时不移动，也不在样本上执行
+    passive = False
+    # 规则自己累加的计数 (属性名)，多进程时子进程里的增量随结果传回主进程
+    counters = ()
+    # 每个句子组的大致耗时 (微秒)，调整规则顺序时与样本上的过滤比例一起决定先后 (见 pipeline.reorder_rules)。
+    # 用固定的估计值而不是现场计时，同样的样本总是得到同样的顺序
+    cost = 1.0
+
+    def __call__(self, sents):
+        return sents
+
+    def batch(self, items):
+        return [self(sents) for sents in items]
+
+    def summary(self):
+        # 日志里在 msg 之后额外打印的一行，没有时为 None
+        return None
+
+    def config(self):
+        # 决定判定结果的参数，作为判定缓存版本的一部分
+        return type(self).__name__, sorted((k, v) for k, v in vars(self).items()
+                                           if k != 'trash' and k not in self.counters
+                                           and isinstance(v, (bool, int, float, str, tuple, list, type(None))))
+
+
+class SideRule(Rule):
+    # 每一侧都要通过 check 才保留
+    cost = 1.5
+
+    def check(self, sent):
+        return True
+
+    def __call__(self, sents):
+        for sent in sents:
+            if not self.check(sent):
+                return None
+        return sents
+
+
+class FeatureRule(Rule):
+    # 阈值规则: 在一块句子组的字符统计特征 (见 features.py) 上整块判定，accept 返回每个句子组是否保留
+    batched = True
+    # 特征由各条阈值规则共用，只算一次
+    cost = 0.5
+
+    def accept(self, feats, items):
+        return np.ones(len(items), dtype=bool)
+
+    def batch(self, items):
+        keep = self.accept(features_of(items), items)
+        return [sents if k else None for sents, k in zip(items, keep.tolist())]
+
+    def __call__(self, sents):
+        return self.batch([sents])[0]
+
+
+# 预处理 (见 text_norm.py)
+class Norm(Rule):
+    name = 'norm'
+    msg = 'After norm, remain %i pairs'
+    rewrites = True
+
+    def norm(self, x):
+        return norm(x)
+
+    def __call__(self, sents):
+        return tuple(map(norm, sents))
+
+
+# 去掉重复，保留第一次出现的句子对。只记录句子对的 64/128 位哈希
+class DupRemove(Rule):
+    name = 'dup_remove'
+    msg = 'After removing duplicated sentences, remain %i pairs'
+    stateful = True
+
+    def __init__(self, digest_size=8):
+        self.digest_size = digest_size
+        self.seen = HashSet(digest_size // 8)
+
+    def __call__(self, sents):
+        if not self.seen.add(pair_key(sents, self.digest_size)):
+            return None
+        return sents
+
+
+# 语料大于内存时的去重: 先用 from_items 把语料扫一遍，在磁盘上分桶排序得到重复行的位图，过滤时按序号查表。
+# 扫描时每个句子组先经过流程里排在去重之前的规则 (规范化、soft html 等，prefix)，键取自到达去重时的文本，
+# 位图按到达去重的句子组编号，所以第 i 次调用对应第 i 个通过了这些规则的句子组，前面的规则过滤掉句子组也不会错位
+class ExternalDupRemove(Rule):
+    name = 'dup_remove'
+    msg = DupRemove.msg
+    stateful = True
+
+    def __init__(self, flags):
+        self.flags = flags
+        self.line = 0
+
+    @classmethod
+    def from_items(cls, items, prefix=(), digest_size=8, tmp_dir=None, chunk_size=10000):
+        # prefix 里的规则在扫描时就执行一遍，不能有状态
+        if any(rule.stateful for rule in prefix):
+            raise ValueError('external dedup cannot run after another stateful rule')
+        rules = list(enumerate(prefix))
+
+        def keys():
+            for chunk in chunked(items, chunk_size):
+                for idx, sents in run_rules(rules, chunk):
+                    if idx is None:
+                        yield pair_key(sents, digest_size)
+            # 扫描时累加的计数 (如 soft html 删掉的字符数) 不计入日志
+            _take_counters(rules)
+
+        return cls(find_duplicates(keys(), digest_size, tmp_dir=tmp_dir))
+
+    def __call__(self, sents):
+        i = self.line
+        self.line += 1
+        if self.flags[i >> 3] >> (i & 7) & 1:
+            return None
+        return sents
+
+
+# 去掉近似重复 (只差几个标点、数字或字) 的句子对，保留第一次出现的 (见 dedup.MinHashLSH)。
+#   threshold: 字符 ngram 的 Jaccard 相似度，只用来挑选 LSH 的分段，不是精确的界限: 相似度为 s 的句子对
+#              以 1 - (1 - s^rows)^bands 的概率被去掉，日志里打印几个相似度下的概率
+#   bands / rows: 直接指定分段，段越多越容易判为重复 (召回高)，每段越长越不容易 (精确高)
+#   side: 'src' / 'tgt' 只比较一侧，'joined' 比较两侧拼接起来的文本
+class NearDupRemove(Rule):
+    name = 'near_dup_remove'
+    msg = 'After removing near-duplicated sentences, remain %i pairs'
+    stateful = True
+    batched = True
+    sides = ('src', 'tgt', 'joined')
+
+    def __init__(self, threshold=0.8, ngram=3, num_perm=64, side='joined', seed=1, capacity=1 << 20, error_rate=1e-5,
+                 bands=None, rows=None):
+        if side not in self.sides:
+            raise ValueError('side must be one of %s' % ', '.join(self.sides))
+        self.threshold = threshold
+        self.side = side
+        self.lsh = MinHashLSH(threshold, ngram, num_perm, seed, capacity, error_rate, bands, rows)
+
+    def text(self, sents):
+        if self.side == 'joined':
+            return '\n'.join(sents)
+        return sents[self.sides.index(self.side)]
+
+    def batch(self, items):
+        kept = self.lsh.add_batch([self.text(sents) for sents in items])
+        return [sents if k else None for sents, k in zip(items, kept)]
+
+    def __call__(self, sents):
+        return self.batch([sents])[0]
+
+    def summary(self):
+        lsh = self.lsh
+        return 'Near-dup LSH uses %i bands x %i rows, a pair with Jaccard similarity %s is removed with probability %s' % (
+            lsh.bands, lsh.rows, '/'.join('%.2g' % s for s in (0.5, 0.7, 0.8, 0.9)),
+            '/'.join('%.2f' % lsh.probability(s) for s in (0.5, 0.7, 0.8, 0.9)))
+
+
+# 去掉与留出集 (验证集、测试集) 共享长 n-gram 的句子对 (见 contamination.py)。
+#   heldout: 留出集文件，两种语言的句子放在同一个索引里，句子对的任何一侧与之重叠都算
+#   ngram: 字符 n-gram 的长度
+#   action: 'drop' 去掉；'flag' 保留，只在日志里报告重叠的句子对数 (命中判定缓存的句子对不计入)
+#   cache: 索引的缓存文件，默认放在第一个留出文件旁边
+class ContaminationRemove(Rule):
+    name = 'contamination_remove'
+    msg = 'After removing sentences overlapping the held-out sets, remain %i pairs'
+    batched = True
+    counters = ('flagged',)
+    actions = ('drop', 'flag')
+    cost = 20.0
+
+    def __init__(self, heldout, ngram=10, action='drop', cache=None):
+        if action not in self.actions:
+            raise ValueError('action must be one of %s' % ', '.join(self.actions))
+        self.heldout = tuple(heldout)
+        self.ngram = ngram
+        self.action = action
+        self.index = NgramIndex.build(self.heldout, ngram, Norm().norm, cache)
+        # 留出集变了判定也跟着变，作为判定缓存版本的一部分
+        self.digest = self.index.digest
+        self.flagged = 0
+
+    @property
+    def passive(self):
+        # flag 模式留在流程里的位置，统计经过它的所有句子对，而不是被移到最后只统计通过了其它规则的
+        return self.action == 'flag'
+
+    def batch(self, items):
+        # 所有句子组的各侧拼成一批查询
+        hits = self.index.hits([sent for sents in items for sent in sents]).reshape(len(items), -1).any(axis=1)
+        if self.action == 'flag':
+            self.flagged += int(hits.sum())
+            return list(items)
+        return [None if hit else sents for sents, hit in zip(items, hits)]
+
+    def __call__(self, sents):
+        return self.batch([sents])[0]
+
+    def summary(self):
+        if self.action == 'flag':
+            return 'Flagged %i pairs overlapping the held-out sets' % self.flagged
+        return None
+
+
+# 去掉soure和target一样的句子
+class SrcTgtSameRemove(Rule):
+    name = 'src_tgt_same_remove'
+    msg = 'After removing same source and target sentence, remain %i pairs'
+    cost = 0.1
+
+    def __call__(self, sents):
+        x, y = sents
+        if x == y:
+            return None
+        return sents
+
+
+# 去掉太长或者太短的句子
+class SentenceLenRemove(FeatureRule):
+    name = 'sentence_len_remove'
+    msg = 'After removing sentences with too less or too many words, reamin %i pairs'
+
+    def __init__(self, min_tok=3, max_tok=100):
+        self.min_tok = min_tok
+        self.max_tok = max_tok
+
+    def accept(self, feats, items):
+        n = feats['len']
+        return ((self.min_tok <= n) & (n <= self.max_tok)).all(axis=1)
+
+
+# 去掉特定符号太多的句子
+class SpPuncRemove(FeatureRule):
+    name = 'sp_punc_remove'
+    msg = 'After removing sentences with too many specific punctuations, reamin %i pairs'
+
+    def __init__(self, max_count=5, max_ratio=0.5):
+        self.max_count = max_count
+        self.max_ratio = max_ratio
+
+    def accept(self, feats, items):
+        fail = (feats['slash'] > self.max_count) | (feats['pipe'] > self.max_count) | (feats['dash'] > self.max_count)
+        # [\d\-\|/]
+        m = feats['digit'] + feats['unidigit'] + feats['slash'] + feats['pipe'] + feats['dash']
+        fail |= m / np.maximum(feats['len'], 1) > self.max_ratio
+        return ~fail.any(axis=1)
+
+
+# 去掉有特殊字符的句子
+class SpCharRemove(SideRule):
+    name = 'sp_char_remove'
+    msg = 'After removing sentences with special characters, remain %i pairs'
+
+    def check(self, sent):
+        return not (r"\x" in sent or u'\xa0' in sent or u'\u3000' in sent or '▅' in sent)
+
+
+# 去掉符号不符合比例的句子
+class PuncRatioRemove(FeatureRule):
+    name = 'punc_ratio_remove'
+    msg = 'After removing sentences with too much punctuations, remain %i pairs'
+
+    def __init__(self, punc_max_num=10, max_ratio=0.5):
+        self.punc_max_num = punc_max_num
+        self.max_ratio = max_ratio
+
+    def accept(self, feats, items):
+        m_punc = feats['punct'] + feats['slash'] + feats['pipe'] + feats['dash']
+        fail = (m_punc / (feats['len'] + 1e-9) > self.max_ratio) | (m_punc > self.punc_max_num)
+        return ~fail.any(axis=1)
+
+
+# 去掉太多字母 太多数字的句子
+class NumAlpRatioRemove(FeatureRule):
+    name = 'numalp_ratio_remove'
+    msg = 'After removing sentences with much numbers or alp, remain %i pairs'
+    # 还要对少数句子做正则匹配
+    cost = 1.5
+
+    def __init__(self, max_ratio=0.5):
+        self.max_ratio = max_ratio
+
+    def accept(self, feats, items):
+        m_numalp = feats['digit'] + feats['alpha']
+        fail = m_numalp / np.maximum(feats['len'], 1) > self.max_ratio
+        # 数字或字母总数不够时不可能出现连续的长串，只对剩下的少数句子做正则匹配
+        for count, width, regex in ((feats['digit'] + feats['unidigit'], 8, DIGIT8_RE), (m_numalp, 15, NUMALP15_RE)):
+            for i, side in zip(*np.nonzero(~fail & (count >= width))):
+                if regex.search(items[i][side]):
+                    fail[i, side] = True
+        return ~fail.any(axis=1)
+
+
+# 去掉source和target中数字字母数量不平衡的句子
+class StNumAlpRatioRemove(FeatureRule):
+    name = 'st_numalp_ratio_remove'
+    msg = 'After removing unbalance source-target number&alp ratio, reamin %i pairs'
+
+    def __init__(self, max_ratio=2):
+        self.max_ratio = max_ratio
+
+    def accept(self, feats, items):
+        pm = feats['digit'] + feats['alpha']
+        pm_x, pm_y = pm[:, 0], pm[:, 1]
+        return ~((pm_x / (pm_y + 1e-9) > self.max_ratio) | (pm_y / (pm_x + 1e-9) > self.max_ratio))
+
+
+# 去掉有网址的句子。
+# soft 时不去掉句子，而是把每一侧的标签、网址和 HTML 实体删掉，删完变成空句的句子对才去掉；
+# 命中判定缓存的句子对不经过这条规则，不计入删掉的字符数
+class HtmlRemove(Rule):
+    name = 'html_remove'
+    msg = 'After removing sentences with html address or tags, remain %i pairs'
+    counters = ('stripped_chars', 'stripped_sents')
+    cost = 3.0
+
+    def __init__(self, soft=False):
+        self.soft = soft
+        self.stripped_chars = 0
+        self.stripped_sents = 0
+
+    @property
+    def rewrites(self):
+        return self.soft
+
+    def check(self, sent):
+        if ('<' in sent and HTML_TAG_RE.search(sent)) or 'https://' in sent or 'http://' in sent:
+            return False
+        return True
+
+    def strip(self, sent):
+        # 绝大多数句子不含这几个字符，不必进入正则
+        if '<' in sent or '&' in sent or '://' in sent or 'www.' in sent:
+            out = SOFT_HTML_RE.sub('', sent)
+            if len(out) != len(sent):
+                self.stripped_chars += len(sent) - len(out)
+                self.stripped_sents += 1
+                return out
+        return sent
+
+    def __call__(self, sents):
+        if self.soft:
+            out = tuple(map(self.strip, sents))
+            if not all(out):
+                return None
+            # 没有改动时返回原来的句子组，后面的规则可以沿用已经算好的特征
+            return sents if out == sents else out
+        # 只有所有侧都含有网址或标签时才去掉
+        for sent in sents:
+            if self.check(sent):
+                return sents
+        return None
+
+    def summary(self):
+        if self.soft:
+            return 'Soft html removed %i characters from %i sentences' % (self.stripped_chars, self.stripped_sents)
+        return None
+
+
+# 去掉1111x1111
+class XRemove(SideRule):
+    name = 'x_remove'
+    msg = 'After removing sentences with 1111x1111, remain %i pairs'
+
+    def check(self, sent):
+        return not ('x' in sent and RESOLUTION_RE.search(sent))
+
+
+# 去掉中文/日文太少的句子，scripts 按侧给出每一侧要求的字符类别 (ZH_CHARS / JA_CHARS)
+class ScriptRatioRemove(FeatureRule):
+    name = 'script_ratio_remove'
+    msg = 'After removing sentences with less chinese or japanese character, remain %i pairs'
+
+    def __init__(self, scripts, min_ratio=0.5, msg=None):
+        self.scripts = scripts
+        self.min_ratio = min_ratio
+        if msg is not None:
+            self.msg = msg
+
+    def accept(self, feats, items):
+        fail = np.zeros(feats.shape, dtype=bool)
+        for side, script in enumerate(self.scripts):
+            f = feats[:, side]
+            count = f['han'] + f['kana'] if script == JA_CHARS else f['han']
+            fail[:, side] = count / np.maximum(f['len'], 1) < self.min_ratio
+        return ~fail.any(axis=1)
+
+
+# emoji
+class EmojiRemove(SideRule):
+    name = 'emoji_remove'
+    msg = 'After removing sentences with emoji, remain %i pairs'
+    cost = 3.5
+
+    def check(self, sent):
+        return not EMOJI_RE.search(sent)
+
+
+# 去掉语言不对的句子，langs 按侧给出期望的语言。
+# 按批打分并缓存结果 (见 langid_stage.py)，默认和逐句调用 langid.classify 的判定相同。
+#   candidates: 只在这些语种 (加上 langs) 之间识别，如 zh/ja 互译时只需分辨中文还是日文
+#   threshold: 识别结果的置信度 (在候选语种之间归一化的概率) 低于它也算语言不对
+#   shortcut: 日文一侧假名比例足够高就直接当作日文，不再打分 (在 valid 上与 langid 判定一致，但不保证处处一致)
+class LangidRemove(Rule):
+    name = 'langid_remove'
+    msg = 'After removing sentences with other language, remain %i pairs'
+    batched = True
+    kana_ratio = 0.1
+    # 没命中缓存时每句要跑一遍模型
+    cost = 100.0
+
+    def __init__(self, langs, candidates=None, threshold=0.0, cache_size=1 << 20, shortcut=False):
+        self.langs = langs
+        self.threshold = threshold
+        self.shortcut = shortcut
+        self.candidates = list(dict.fromkeys(list(candidates) + list(langs))) if candidates else None
+        # 提前加载模型，多进程时子进程直接继承，不必各自再加载一次
+        self.scorer = LangidScorer(self.candidates, cache_size)
+
+    def decided(self, sent, lang):
+        if self.shortcut and lang == 'ja':
+            return char_classes(sent).count('K') / (len(sent) or 1) >= self.kana_ratio
+        return False
+
+    def batch(self, items):
+        alive = range(len(items))
+        # 和逐句判定一样，前一侧语言不对的句子对不再识别后一侧
+        for side, lang in enumerate(self.langs):
+            todo = [i for i in alive if not self.decided(items[i][side], lang)]
+            preds = dict(zip(todo, self.scorer.predict([items[i][side] for i in todo])))
+            alive = [i for i in alive if i not in preds or preds[i][0] == lang and preds[i][1] >= self.threshold]
+        outs = [None] * len(items)
+        for i in alive:
+            outs[i] = items[i]
+        return outs
+
+    def __call__(self, sents):
+        return self.batch([sents])[0]
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_worker_segments = None
+_worker_stats = None
+
+
+def _init_worker(segments, stats=None):
+    # stats: 需要统计时为 (规则数, 样本数)，每块各自统计后随结果传回主进程
+    global _worker_segments, _worker_stats
+    _worker_segments = segments
+    _worker_stats = stats
+
+
+# 让一块句子组流过一串规则 [(下标, 规则)]，对每个句子组返回 (拒绝它的规则下标或 None, 该规则的输入或最后的输出)。
+# 普通规则逐句执行，一旦被拒绝立即停止；batched 规则每次拿到这一块中仍然存活的全部句子组
+def run_rules(rules, chunk, stats=None):
+    if stats is not None:
+        return _run_timed(rules, chunk, stats)
+    results = [None] * len(chunk)
+    pos, cur = range(len(chunk)), chunk
+    start = 0
+    while start < len(rules) and cur:
+        if rules[start][1].batched:
+            i, rule = rules[start]
+            end = start + 1
+            verdicts = [(None, out) if out is not None else (i, sents) for sents, out in zip(cur, rule.batch(cur))]
+        else:
+            end = start
+            while end < len(rules) and not rules[end][1].batched:
+                end += 1
+            verdicts = [_run_items(rules[start:end], sents) for sents in cur]
+        next_pos, next_cur = [], []
+        for p, (idx, sents) in zip(pos, verdicts):
+            if idx is None:
+                next_pos.append(p)
+                next_cur.append(sents)
+            else:
+                results[p] = (idx, sents)
+        pos, cur = next_pos, next_cur
+        start = end
+    for p, sents in zip(pos, cur):
+        results[p] = (None, sents)
+    return results
+
+
+def _run_items(rules, sents):
+    for i, rule in rules:
+        out = rule(sents)
+        if out is None:
+            return i, sents
+        sents = out
+    return None, sents
+
+
+# 统计耗时时按规则整块执行 (见 instrument.py)，判定与 run_rules 相同
+def _run_timed(rules, chunk, stats):
+    results = [None] * len(chunk)
+    pos, cur = range(len(chunk)), chunk
+    for i, rule in rules:
+        if not cur:
+            break
+        next_pos, next_cur = [], []
+        for p, sents, out in zip(pos, cur, stats.run(i, rule.batch, cur)):
+            if out is None:
+                results[p] = (i, sents)
+            else:
+                next_pos.append(p)
+                next_cur.append(out)
+        pos, cur = next_pos, next_cur
+    for p, sents in zip(pos, cur):
+        results[p] = (None, sents)
+    return results
+
+
+# 子进程: 让一块句子组流过第 stage 段的无状态规则，返回判定、这一块的统计 (不统计时为 None) 和各规则计数的增量
+def _run_segment(stage, chunk):
+    stats = RuleStats(*_worker_stats) if _worker_stats is not None else None
+    results = run_rules(_worker_segments[stage], chunk, stats)
+    return results, stats, _take_counters(_worker_segments[stage])
+
+
+def _take_counters(rules):
+    # 取出并清零各规则的计数，返回 [(规则下标, 属性名, 增量)]
+    counts = []
+    for i, rule in rules:
+        for name in rule.counters:
+            counts.append((i, name, getattr(rule, name)))
+            setattr(rule, name, 0)
+    return counts
+
+
+# 规则的实现改变了判定结果 (或判定缓存的格式) 时加一，让旧的判定缓存失效
+RULES_VERSION = 3
+
+
+def rules_version(rules):
+    # 规则顺序决定由哪条规则拒绝，也是版本的一部分 (reorder_rules 对同样的样本总是给出同样的顺序)；
+    # 有状态规则不经过缓存，只占个位置
+    return '%i:%r' % (RULES_VERSION, [None if rule.stateful else rule.config() for rule in rules])
+
+
+class RuleChain(object):
+
+    # on_trash: 可选回调，被 trash=True 的规则过滤掉时以 (规则处理前的句子组, 规则下标, 输入中的行号 (从 1 开始)) 调用
+    # cache: 可选的 VerdictCache。最后一条有状态规则之后的规则只依赖句子组本身，它们的判定从缓存里取，
+    #        只有没见过的句子组才真正检查
+    # stats: 可选的 RuleStats，记录每条规则的耗时和峰值内存增长 (见 instrument.py)
+    def __init__(self, rules, on_trash=None, cache=None, stats=None):
+        self.rules = rules
+        self.on_trash = on_trash
+        self.cache = cache
+        self.stats = stats
+        self.total = 0
+        # 已经给出判定的输入行数，判定总是按输入顺序给出
+        self.line = 0
+        self.rejected = [0] * len(rules)
+        stateful = [i for i, rule in enumerate(rules) if rule.stateful]
+        self.cached_from = stateful[-1] + 1 if stateful else 0
+
+    def __call__(self, sents):
+        self.total += 1
+        self.line += 1
+        for i, rule in enumerate(self.rules):
+            out = rule(sents)
+            if out is None:
+                self.reject(i, sents)
+                return None
+            sents = out
+        return sents
+
+    def reject(self, i, sents):
+        self.rejected[i] += 1
+        if self.rules[i].trash and self.on_trash is not None:
+            self.on_trash(sents, i, self.line)
+
+    def emit(self, verdicts):
+        # 按输入顺序给出一块的判定: 通过的句子组交给调用方，被拒绝的计数
+        for idx, sents in verdicts:
+            self.line += 1
+            if idx is None:
+                yield sents
+            else:
+                self.reject(idx, sents)
+
+    def filter(self, items, workers=1, chunk_size=10000):
+        if workers > 1:
+            yield from self.parallel_filter(items, workers, chunk_size)
+            return
+        if self.cache is None and self.stats is None and not any(rule.batched for rule in self.rules):
+            for sents in items:
+                sents = self(sents)
+                if sents is not None:
+                    yield sents
+            return
+        # 有整批处理的规则、判定缓存或统计时按块执行，块内按输入顺序经过有状态规则，结果也按输入顺序给出
+        rules = list(enumerate(self.rules))
+        for chunk in chunked(items, chunk_size):
+            self.total += len(chunk)
+            if self.cache is None:
+                verdicts = run_rules(rules, chunk, self.stats)
+            else:
+                verdicts = run_rules(rules[:self.cached_from], chunk, self.stats)
+                pos = [p for p, (idx, _) in enumerate(verdicts) if idx is None]
+                for p, verdict in zip(pos, self.run_cached(rules[self.cached_from:], [verdicts[p][1] for p in pos])):
+                    verdicts[p] = verdict
+            yield from self.emit(verdicts)
+
+    def run_cached(self, rules, chunk):
+        keys, verdicts, todo = self.cache.lookup(chunk)
+        fresh = run_rules(rules, [chunk[p] for p in todo], self.stats)
+        self.cache.put([(keys[p], chunk[p], verdict) for p, verdict in zip(todo, fresh)])
+        verdicts.update(zip(todo, fresh))
+        return [verdicts[p] for p in range(len(chunk))]
+
+    # 多进程版本: 有状态的规则 (去重) 把规则链切成若干段，每段无状态规则按块交给进程池，
+    # 段与段之间在主进程里按输入顺序执行有状态规则。重复的句子对不会进入后面的段，
+    # 结果也按原顺序取回，因此输出、计数和垃圾箱内容都和单进程完全一致
+    def parallel_filter(self, items, workers, chunk_size=10000):
+        stateful = [i for i, rule in enumerate(self.rules) if rule.stateful]
+        bounds = [-1] + stateful + [len(self.rules)]
+        segments = [[(i, self.rules[i]) for i in range(lo + 1, hi)] for lo, hi in zip(bounds, bounds[1:])]
+        last = len(segments) - 1
+        # queues[k]: 已提交到第 k 段、按输入顺序排队的 (verdicts, 位置, 异步结果, 判定缓存的键)
+        queues = [deque() for _ in segments]
+
+        def submit(pool, k, verdicts, pos, chunk):
+            keys = None
+            if self.cache is not None and k == last:
+                # 最后一段的判定先查缓存，只把没见过的句子组交给进程池
+                keys, cached, todo = self.cache.lookup(chunk)
+                for p, verdict in cached.items():
+                    verdicts[pos[p]] = verdict
+                keys = [(keys[p], chunk[p]) for p in todo]
+                pos = [pos[p] for p in todo]
+                chunk = [chunk[p] for p in todo]
+            queues[k].append((verdicts, pos, pool.apply_async(_run_segment, (k, chunk)), keys))
+
+        def advance(pool, k):
+            verdicts, pos, res, keys = queues[k].popleft()
+            res, stats, counts = res.get()
+            if stats is not None:
+                self.stats.merge(stats)
+            for i, name, n in counts:
+                setattr(self.rules[i], name, getattr(self.rules[i], name) + n)
+            if keys is not None:
+                self.cache.put([(key, sents, verdict) for (key, sents), verdict in zip(keys, res)])
+            survivors = []
+            for p, (idx, sents) in zip(pos, res):
+                if idx is not None:
+                    verdicts[p] = (idx, sents)
+                elif k == last:
+                    verdicts[p] = (None, sents)
+                else:
+                    survivors.append((p, sents))
+            # 段之间的有状态规则在主进程里按输入顺序执行
+            next_pos, next_chunk = [], []
+            if survivors:
+                for (p, sents), (idx, out) in zip(survivors, run_rules([(stateful[k], self.rules[stateful[k]])],
+                                                                       [sents for _, sents in survivors], self.stats)):
+                    if idx is not None:
+                        verdicts[p] = (idx, sents)
+                    else:
+                        next_pos.append(p)
+                        next_chunk.append(out)
+            if k < last:
+                submit(pool, k + 1, verdicts, next_pos, next_chunk)
+                return
+            yield from self.emit(verdicts)
+
+        def drain(pool, limit):
+            # 总是先推进最靠后的段，它里面的块也是最早读入的
+            while sum(len(q) for q in queues) > limit:
+                k = max(k for k, q in enumerate(queues) if q)
+                yield from advance(pool, k)
+
+        worker_stats = None
+        if self.stats is not None:
+            worker_stats = (len(self.rules), self.stats.profile_lines)
+        with Pool(workers, initializer=_init_worker, initargs=(segments, worker_stats)) as pool:
+            for chunk in chunked(items, chunk_size):
+                self.total += len(chunk)
+                submit(pool, 0, [None] * len(chunk), range(len(chunk)), chunk)
+                # 限制在途的块数，避免读入速度快于处理速度时占满内存
+                yield from drain(pool, 2 * workers)
+            yield from drain(pool, 0)
+
+    @property
+    def remain(self):
+        return self.total - sum(self.rejected)
+
+    def report(self, file=sys.stdout):
+        remain = self.total
+        for rule, n in zip(self.rules, self.rejected):
+            remain -= n
+            print(rule.msg % remain, file=file)
+            if rule.summary() is not None:
+                print(rule.summary(), file=file)
+        if self.cache is not None:
+            print('Verdict cache: reused %i pairs, checked %i new pairs' % (self.cache.hits, self.cache.misses), file=file)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 透明读写 .gz / .zst 文件: 按扩展名判断压缩格式，其它文件照常打开。
+#
+# 压缩和解压尽量交给外部程序 (pigz / gzip / zstd) 的子进程，和过滤并行执行；zstd 压缩用 -T0 按核数多线程。
+# 找不到这些程序时退回 Python 的 gzip / zstandard 模块 (zstandard 是可选依赖)，在后台线程里读写，
+# zlib 和 zstd 压缩解压时会释放 GIL，同样能和主线程重叠。
+# 追加模式 ('a') 在文件末尾接一个新的压缩帧，gzip 和 zstd 都能把多个帧连起来读出。
+
+import io
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+BLOCK_SIZE = 1 << 20
+
+# 扩展名 -> 格式
+SUFFIXES = {'.gz': 'gz', '.zst': 'zst'}
+
+
+def compression(path):
+    # 文件的压缩格式，不压缩时为 None
+    return SUFFIXES.get(os.path.splitext(path)[1])
+
+
+def output_path(path, suffix, compress=None):
+    # 输入文件对应的输出文件名，压缩扩展名保持在最后: c.zh.gz -> c.zh.clean.gz
+    # compress: 'gz' / 'zst' / 'none'，默认与输入相同
+    fmt = compression(path)
+    base = path[:-len(os.path.splitext(path)[1])] if fmt else path
+    if compress is not None:
+        fmt = None if compress == 'none' else compress
+    return base + suffix + ('.' + fmt if fmt else '')
+
+
+def decompress_command(fmt):
+    if fmt == 'gz':
+        for tool in ('pigz', 'gzip'):
+            if shutil.which(tool):
+                return [tool, '-dc']
+    elif shutil.which('zstd'):
+        return ['zstd', '-dcq']
+    return None
+
+
+def compress_command(fmt, threads=0):
+    # threads: 压缩线程数，0 表示按核数
+    if fmt == 'gz':
+        if shutil.which('pigz'):
+            return ['pigz', '-c'] + (['-p', str(threads)] if threads else [])
+        if shutil.which('gzip'):
+            return ['gzip', '-c']
+    elif shutil.which('zstd'):
+        return ['zstd', '-cq', '-T%i' % threads]
+    return None
+
+
+def python_open(path, fmt, mode):
+    # 没有外部程序时用 Python 模块打开，返回二进制文件对象
+    if fmt == 'gz':
+        import gzip
+        return gzip.open(path, mode + 'b')
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('reading or writing %s needs the zstd program or the zstandard module' % path)
+    if mode == 'r':
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return zstandard.ZstdCompressor(threads=-1).stream_writer(open(path, mode + 'b'), closefd=True)
+
+
+class ProcessReader(io.RawIOBase):
+    # 子进程解压，从它的标准输出读
+
+    def __init__(self, cmd, path):
+        self.path = path
+        self.proc = subprocess.Popen(cmd + [path], stdout=subprocess.PIPE, bufsize=BLOCK_SIZE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.proc.stdout.readinto(b)
+        if not n and self.proc.wait() != 0:
+            raise OSError('decompressing %s failed (exit code %i)' % (self.path, self.proc.returncode))
+        return n
+
+    def close(self):
+        if not self.closed:
+            # 没读完就关闭时 (如只读前几行) 结束子进程
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.stdout.close()
+            self.proc.wait()
+        super().close()
+
+
+class ProcessWriter(io.RawIOBase):
+    # 子进程压缩，写到它的标准输入，它的输出写进文件
+
+    def __init__(self, cmd, path, mode):
+        self.path = path
+        with open(path, mode + 'b') as f:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=f, bufsize=BLOCK_SIZE)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.proc.stdin.write(b)
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            self.proc.stdin.close()
+            if self.proc.wait() != 0:
+                raise OSError('compressing %s failed (exit code %i)' % (self.path, self.proc.returncode))
+        super().close()
+
+
+class ThreadReader(io.RawIOBase):
+    # 后台线程从 f 读出解压后的数据块，放进有界队列
+
+    def __init__(self, f):
+        self.f = f
+        self.queue = queue.Queue(maxsize=8)
+        self.stop = threading.Event()
+        self.buf = b''
+        self.eof = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                block = self.f.read(BLOCK_SIZE)
+                self.put(block)
+                if not block:
+                    break
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.buf:
+            if self.eof:
+                return 0
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.buf = item
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+            self.f.close()
+        super().close()
+
+
+class ThreadWriter(io.RawIOBase):
+    # 后台线程把数据块写进 f (压缩在这个线程里进行)
+
+    def __init__(self, f):
+        self.f = f
+        self.queue = queue.Queue(maxsize=8)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if self.error is None:
+                try:
+                    self.f.write(block)
+                except Exception as e:
+                    self.error = e
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(bytes(b))
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            self.queue.put(None)
+            self.thread.join()
+            self.f.close()
+            if self.error is not None:
+                raise self.error
+        super().close()
+
+
+def open_binary(path, mode='r', threads=0):
+    # 解压后 / 压缩前的二进制流 (带缓冲)；mode: 'r' / 'w' / 'a'
+    fmt = compression(path)
+    if fmt is None:
+        return open(path, mode + 'b', buffering=BLOCK_SIZE)
+    if mode == 'r':
+        cmd = decompress_command(fmt)
+        raw = ProcessReader(cmd, path) if cmd else ThreadReader(python_open(path, fmt, mode))
+        return io.BufferedReader(raw, BLOCK_SIZE)
+    cmd = compress_command(fmt, threads)
+    raw = ProcessWriter(cmd, path, mode) if cmd else ThreadWriter(python_open(path, fmt, mode))
+    return io.BufferedWriter(raw, BLOCK_SIZE)
+
+
+def open_text(path, mode='r', threads=0):
+    # 和 open(path, mode, encoding='utf8') 一样使用；读取时只按 \n 分行
+    newline = '\n' if mode == 'r' else None
+    if compression(path) is None:
+        return open(path, mode, encoding='utf8', newline=newline, buffering=BLOCK_SIZE)
+    return io.TextIOWrapper(open_binary(path, mode, threads), encoding='utf8', newline=newline)
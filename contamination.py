@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 训练语料与留出集 (验证集、测试集) 的重叠检查。
+#
+# 留出集的每个句子规范化后取字符 n-gram 的 64 位哈希 (与 dedup.ngram_hashes 相同)，排序去重后作为索引缓存在磁盘上，
+# 留出文件没有变化 (路径、大小和修改时间都相同) 时直接读取缓存。查询时整批计算训练句子的 n-gram 哈希并在索引里二分查找，
+# 每行的开销只与句子长度有关，与语料规模无关。短于 n 的留出句子只有整句相同才算重叠。
+
+import json
+import os
+from hashlib import blake2b
+
+import numpy as np
+
+from compressed import open_text
+from dedup import ngram_hashes
+
+
+def heldout_digest(paths, n):
+    meta = [n]
+    for path in paths:
+        st = os.stat(path)
+        meta.append((os.path.abspath(path), st.st_size, st.st_mtime_ns))
+    return blake2b(json.dumps(meta).encode('utf8'), digest_size=8).hexdigest()
+
+
+class NgramIndex(object):
+
+    def __init__(self, hashes, n, digest):
+        self.hashes = hashes
+        self.n = n
+        self.digest = digest
+
+    @classmethod
+    def build(cls, paths, n=10, normalize=None, cache=None, batch_size=10000):
+        # cache: 索引的缓存文件，默认放在第一个留出文件旁边
+        digest = heldout_digest(paths, n)
+        cache = cache or '%s.ngram%i.npz' % (paths[0], n)
+        if os.path.exists(cache):
+            with np.load(cache) as f:
+                if str(f['digest']) == digest:
+                    return cls(f['hashes'], n, digest)
+        parts = []
+        for path in paths:
+            with open_text(path) as f:
+                lines = [normalize(line) if normalize else line.strip() for line in f]
+            for start in range(0, len(lines), batch_size):
+                parts.append(ngram_hashes(lines[start:start + batch_size], n)[0])
+        hashes = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.uint64)
+        # 先写临时文件再替换，避免同时运行的另一个进程读到写了一半的缓存
+        with open(cache + '.tmp', 'wb') as f:
+            np.savez(f, hashes=hashes, digest=np.array(digest))
+        os.replace(cache + '.tmp', cache)
+        return cls(hashes, n, digest)
+
+    def hits(self, texts):
+        # 每个文本有多少个 n-gram 出现在留出集里
+        h, counts = ngram_hashes(texts, self.n)
+        if not len(h):
+            return np.zeros(len(texts), dtype=np.int64)
+        pos = np.searchsorted(self.hashes, h)
+        found = self.hashes[np.minimum(pos, len(self.hashes) - 1)] == h if len(self.hashes) else np.zeros(len(h), bool)
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return np.add.reduceat(found.astype(np.int64), firsts)
+
+    def __len__(self):
+        return len(self.hashes)
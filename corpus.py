@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 语料文件的读取: 把文件映射到内存 (mmap)，不必先把整个文件读进来就能开始处理，多个进程读同一个文件时共用系统的页缓存。
+#
+# 每行的起始字节偏移存成 uint64 数组，缓存在文件旁边的 <file>.lineidx 里: 头部是 (格式版本, 文件大小, 修改时间) 三个 uint64，
+# 之后是 行数 + 1 个偏移 (最后一个是文件末尾)。文件没有变化时直接映射这个索引，否则扫一遍换行重建。
+# 有了索引就可以按行号随机读取、按块迭代，或按字节数把行区间切成大致相等的几份交给多个进程。
+# 行只按 \n 切分，迭代得到的行和逐行读文件一样带着行尾的 \n。
+# 压缩文件 (.gz / .zst) 不能映射，open_corpus 给出 StreamCorpus: 每次迭代都在后台重新解压一遍 (见 compressed.py)，
+# 只能顺序读取。
+#
+#   python corpus.py c.zh                    # 建好索引，打印行数
+#   python corpus.py c.zh --lines 100:110    # 打印第 100 到 109 行 (从 0 开始)
+#   python corpus.py c.zh --split 4          # 按字节数切成 4 份的行区间
+
+import argparse
+import io
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from compressed import compression, open_binary, open_text
+
+INDEX_VERSION = 1
+# 建索引时每次扫描的字节数
+SCAN_BLOCK = 1 << 26
+
+
+def line_offsets(buf):
+    # buf 中每行的起始偏移，最后加上末尾；最后一行没有 \n 时也算一行
+    size = len(buf)
+    parts = [np.zeros(1, dtype=np.uint64)]
+    for start in range(0, size, SCAN_BLOCK):
+        block = np.frombuffer(buf, dtype=np.uint8, count=min(SCAN_BLOCK, size - start), offset=start)
+        parts.append((np.flatnonzero(block == 10) + (start + 1)).astype(np.uint64))
+    if size and buf[size - 1] != 10:
+        parts.append(np.array([size], dtype=np.uint64))
+    return np.concatenate(parts)
+
+
+class Corpus(object):
+
+    # index: 行偏移索引的缓存文件，默认 <path>.lineidx；为 False 时不缓存。所在目录不可写时只在内存里建索引
+    def __init__(self, path, index=None):
+        self.path = path
+        self.f = open(path, 'rb')
+        st = os.fstat(self.f.fileno())
+        self.size = st.st_size
+        # 空文件不能映射
+        self.buf = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.offsets = self.load_index(path + '.lineidx' if index is None else index, st)
+
+    def load_index(self, path, st):
+        header = np.array([INDEX_VERSION, st.st_size, st.st_mtime_ns], dtype=np.uint64)
+        if path and os.path.exists(path) and os.path.getsize(path) >= 4 * 8:
+            index = np.memmap(path, dtype=np.uint64, mode='r')
+            if (index[:3] == header).all():
+                return index[3:]
+        offsets = line_offsets(self.buf)
+        if path:
+            try:
+                # 先写临时文件再替换，避免同时运行的另一个进程读到写了一半的索引
+                with open(path + '.tmp', 'wb') as f:
+                    header.tofile(f)
+                    offsets.tofile(f)
+                os.replace(path + '.tmp', path)
+            except OSError:
+                pass
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, start, stop):
+        # 第 start 到 stop - 1 行的原文
+        return self.buf[int(self.offsets[start]):int(self.offsets[stop])].decode('utf8')
+
+    def lines(self, start=0, stop=None, keepends=True, chunk_size=10000):
+        # 逐行给出 [start, stop) 的行，每次解码 chunk_size 行
+        for chunk in self.chunks(chunk_size, start, stop, keepends):
+            yield from chunk
+
+    def chunks(self, size, start=0, stop=None, keepends=True):
+        # 每次给出 size 行的列表
+        stop = len(self) if stop is None else min(stop, len(self))
+        for lo in range(start, stop, size):
+            hi = min(lo + size, stop)
+            if keepends:
+                # newline='\n': 只按 \n 切分，不转换 \r
+                yield io.StringIO(self.text(lo, hi), newline='\n').readlines()
+                continue
+            lines = self.text(lo, hi).split('\n')
+            # 最后一个元素是最后一行 \n 之后的部分: 文件末尾没有 \n 的最后一行，否则为空
+            if not lines[-1]:
+                lines.pop()
+            yield lines
+
+    def __iter__(self):
+        return self.lines()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            lines = [line for chunk in self.chunks(max(stop - start, 1), start, stop) for line in chunk]
+            return lines[::step] if step != 1 else lines
+        i = range(len(self))[i]
+        return self.text(i, i + 1)
+
+    def ranges(self, parts):
+        # 把所有行切成 parts 个连续区间 [(start, stop)]，每个区间的字节数大致相等
+        bounds = np.searchsorted(self.offsets, np.linspace(0, self.size, parts + 1)[1:-1])
+        bounds = [0] + sorted(set(int(b) for b in bounds) - {0, len(self)}) + [len(self)]
+        return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamCorpus(object):
+    # 压缩文件的顺序读取，接口是 Corpus 的一部分；行数未知
+
+    def __init__(self, path):
+        self.path = path
+
+    def lines(self, start=0, stop=None, keepends=True, chunk_size=None):
+        f = open_text(self.path)
+        try:
+            for i, line in enumerate(f):
+                if stop is not None and i >= stop:
+                    break
+                if i >= start:
+                    yield line if keepends or not line.endswith('\n') else line[:-1]
+        finally:
+            # 提前结束 (只读前几行、另一侧的文件先读完) 时也结束后台的解压
+            f.close()
+
+    def chunks(self, size, start=0, stop=None, keepends=True):
+        chunk = []
+        for line in self.lines(start, stop, keepends):
+            chunk.append(line)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def __iter__(self):
+        return self.lines()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_corpus(path):
+    return StreamCorpus(path) if compression(path) else Corpus(path)
+
+
+def stream_blocks(f, bar=None, block_size=1 << 16):
+    # 从二进制流 f 边读边切行: 每读到一块数据就交出其中完整的行 (去掉 \n) 组成的列表，不等读完整个输入。
+    # read1 有多少数据就返回多少，上游慢时块小、延迟低，上游快时块大、开销小。bar: 按字节数更新的 tqdm
+    rest = b''
+    while True:
+        data = f.read1(block_size)
+        if not data:
+            break
+        if bar is not None:
+            bar.update(len(data))
+        lines = (rest + data).split(b'\n')
+        rest = lines.pop()
+        if lines:
+            yield [line.decode('utf8') for line in lines]
+    if rest:
+        yield [rest.decode('utf8')]
+
+
+def line_blocks(path=None, bar=None, size=10000):
+    # 逐块给出输入的行 (去掉 \n)，path 为 None 时读标准输入；bar 按读过的字节数更新，总字节数见 input_size
+    if path is None:
+        yield from stream_blocks(sys.stdin.buffer, bar)
+    elif compression(path):
+        with open_binary(path) as f:
+            yield from stream_blocks(f, bar)
+    else:
+        with Corpus(path) as corpus:
+            for lo in range(0, len(corpus), size):
+                hi = min(lo + size, len(corpus))
+                yield next(corpus.chunks(size, lo, hi, keepends=False))
+                if bar is not None:
+                    bar.update(int(corpus.offsets[hi] - corpus.offsets[lo]))
+
+
+def input_size(path=None):
+    # 输入的字节数，标准输入和压缩文件 (解压后的大小) 未知，为 None
+    return os.path.getsize(path) if path and not compression(path) else None
+
+
+def line_count(*corpora):
+    # 几个语料里最短的行数，有压缩文件 (行数未知) 时为 None
+    if any(isinstance(corpus, StreamCorpus) for corpus in corpora):
+        return None
+    return min(len(corpus) for corpus in corpora)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='corpus file, the line index is cached in <path>.lineidx')
+    parser.add_argument('--lines', default=None, metavar='START:STOP', help='print these lines (0-based, STOP excluded)')
+    parser.add_argument('--split', type=int, default=None, metavar='N',
+                        help='print N line ranges of about the same number of bytes')
+    args = parser.parse_args()
+
+    with Corpus(args.path) as corpus:
+        if args.lines is not None:
+            start, _, stop = args.lines.partition(':')
+            for line in corpus.lines(int(start or 0), int(stop) if stop else None):
+                sys.stdout.write(line if line.endswith('\n') else line + '\n')
+        elif args.split is not None:
+            for start, stop in corpus.ranges(args.split):
+                print('%i\t%i' % (start, stop))
+        else:
+            print(len(corpus))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 句子对去重: 以 (src, tgt) 的 64/128 位哈希为键，保留第一次出现的句子对。
+#
+# 内存够用时用 HashSet (键直接存在 array 里，每个键 8/16 字节)；
+# 语料比内存还大时用 find_duplicates: 把 (键, 行号) 按键的高位分桶写到磁盘，再逐桶排序找出重复行，
+# 结果是每行一位的位图，第二遍读语料时按行号查表即可。
+#
+# 近似重复 (只差几个标点、数字或字) 用 MinHashLSH: 字符 n-gram 的 MinHash 签名分成 bands 段，每段 rows 个值，
+# 任何一段与之前保留的句子完全相同就算重复，不再核对相似度。Jaccard 相似度为 s 的两个文本被判为重复的概率是
+# 1 - (1 - s^rows)^bands，是一条 S 形曲线而不是阈值处的阶跃: 阈值只用来挑选让曲线最接近阶跃的 (bands, rows)，
+# 略低于阈值的也可能被去掉，略高于阈值的也可能保留 (如 0.8、64 个排列时为 5 x 11，相似度 0.85 时约有四成漏掉)。
+# 要更偏向召回或精确可以直接给出 bands 和 rows。
+# 各段的哈希只记在按需扩容的布隆过滤器里，每个句子对只占固定的几十个位，与句子长度无关；
+# 布隆过滤器本身还有少量误判 (把不相似的句子对当作重复)，概率由 error_rate 控制。
+
+import math
+import os
+import tempfile
+from array import array
+from hashlib import blake2b
+
+import numpy as np
+
+
+def pair_key(sents, digest_size=8):
+    # 句子里不会有换行，用换行拼接不会产生歧义
+    return int.from_bytes(blake2b('\n'.join(sents).encode('utf8'), digest_size=digest_size).digest(), 'little')
+
+
+class HashSet(object):
+    # 开放寻址 (线性探测) 的整数集合，每个槽占 words 个 64 位字，全 0 表示空槽，负载不超过一半
+
+    def __init__(self, words=1, capacity=1 << 16):
+        self.words = words
+        self.size = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = array('Q', bytes(8 * self.words * capacity))
+
+    def _split(self, key):
+        words = [(key >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(self.words)]
+        if not any(words):
+            words[0] = 1
+        return words
+
+    def add(self, key):
+        # 新加入返回 True，已经存在返回 False
+        if self.words == 1:
+            added = self._add1(key & 0xFFFFFFFFFFFFFFFF or 1)
+        else:
+            added = self._addn(self._split(key))
+        if added:
+            self.size += 1
+            if self.size * 2 > self.capacity:
+                self._grow()
+        return added
+
+    def _add1(self, k):
+        keys, mask = self.keys, self.mask
+        i = k & mask
+        while True:
+            slot = keys[i]
+            if slot == 0:
+                keys[i] = k
+                return True
+            if slot == k:
+                return False
+            i = (i + 1) & mask
+
+    def _addn(self, words):
+        keys, mask, n = self.keys, self.mask, self.words
+        i = words[0] & mask
+        while True:
+            slot = keys[i * n:(i + 1) * n]
+            if not any(slot):
+                keys[i * n:(i + 1) * n] = array('Q', words)
+                return True
+            if slot.tolist() == words:
+                return False
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old, n = self.keys, self.words
+        self._alloc(self.capacity * 2)
+        for i in range(0, len(old), n):
+            words = old[i:i + n].tolist()
+            if any(words):
+                if n == 1:
+                    self._add1(words[0])
+                else:
+                    self._addn(words)
+
+    def __len__(self):
+        return self.size
+
+
+def find_duplicates(keys, digest_size=8, run_size=1 << 20, n_buckets=256, tmp_dir=None):
+    # keys: 按输入顺序给出每行的键。返回 bytearray 位图，第 i 位为 1 表示第 i 行是前面某行的重复
+    words = digest_size // 8
+    dtype = np.dtype([('w%i' % i, '<u8') for i in reversed(range(words))] + [('line', '<u8')])
+    shift = 64 - (n_buckets - 1).bit_length()
+
+    with tempfile.TemporaryDirectory(prefix='dedup.', dir=tmp_dir) as tmp:
+        paths = [os.path.join(tmp, '%03i.bin' % b) for b in range(n_buckets)]
+        n = 0
+
+        def spill(run, start):
+            # 一批键按最高的若干位分桶，追加到各个桶文件里，行号天然递增
+            run = np.frombuffer(run, dtype='<u8').reshape(-1, words)
+            records = np.empty(len(run), dtype=dtype)
+            for i in range(words):
+                records['w%i' % i] = run[:, i]
+            records['line'] = np.arange(start, start + len(run), dtype='<u8')
+            buckets = records['w%i' % (words - 1)] >> np.uint64(shift)
+            order = np.argsort(buckets, kind='stable')
+            bounds = np.searchsorted(buckets[order], np.arange(n_buckets + 1))
+            for b in range(n_buckets):
+                if bounds[b] < bounds[b + 1]:
+                    with open(paths[b], 'ab') as f:
+                        records[order[bounds[b]:bounds[b + 1]]].tofile(f)
+
+        run = array('Q')
+        start = 0
+        for key in keys:
+            for i in range(words):
+                run.append((key >> (64 * i)) & 0xFFFFFFFFFFFFFFFF)
+            n += 1
+            if len(run) >= run_size * words:
+                spill(run, start)
+                start = n
+                run = array('Q')
+        if run:
+            spill(run, start)
+
+        flags = np.zeros((n + 7) // 8, dtype=np.uint8)
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            records = np.fromfile(path, dtype=dtype)
+            os.remove(path)
+            # 稳定排序: 同一个键的记录保持行号递增，第一条之后的都是重复
+            order = np.argsort(records[[name for name in dtype.names if name != 'line']], kind='stable')
+            records = records[order]
+            same = np.ones(len(records), dtype=bool)
+            for i in range(words):
+                col = records['w%i' % i]
+                same[1:] &= col[1:] == col[:-1]
+            same[0] = False
+            dup = records['line'][same]
+            np.bitwise_or.at(flags, dup >> np.uint64(3), np.left_shift(1, dup & np.uint64(7)).astype(np.uint8))
+
+    return bytearray(flags.tobytes())
+
+
+_U64 = 0xFFFFFFFFFFFFFFFF
+_PRIME = np.uint64(0x100000001B3)
+
+
+def _mix(h):
+    # splitmix64 的末尾混合，把 uint64 数组打散
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def ngram_hashes(texts, n):
+    # 所有文本的字符 n-gram 的 64 位哈希按顺序拼在一起，以及每个文本的 n-gram 个数；短于 n 的文本整个作为一个 n-gram
+    if not texts:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    lens = np.array([len(t) for t in texts], dtype=np.int64)
+    # 文本之间用 n-1 个 NUL 隔开，n-gram 不会跨过两个文本
+    pad = '\0' * (n - 1)
+    cps = np.frombuffer((pad.join(texts) + '\0' * n).encode('utf-32-le'), dtype='<u4').astype(np.uint64)
+    h = np.zeros(len(cps) - n + 1, dtype=np.uint64)
+    for j in range(n):
+        h = h * _PRIME + cps[j:len(cps) - n + 1 + j]
+    counts = np.maximum(lens - n + 1, 1)
+    starts = np.concatenate(([0], np.cumsum(lens + n - 1)[:-1]))
+    firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return _mix(h[np.repeat(starts - firsts, counts) + np.arange(counts.sum())]), counts
+
+
+def lsh_params(threshold, num_perm):
+    # 在 bands * rows <= num_perm 中选择让 Jaccard 相似度低于阈值却碰撞、高于阈值却没碰撞的概率之和最小的 (bands, rows)
+    s = np.linspace(0, 1, 201)
+    below = s <= threshold
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            p = 1 - (1 - s ** rows) ** bands
+            fp = np.where(below, p, 0).sum() / (len(s) - 1)
+            fn = np.where(below, 0, 1 - p).sum() / (len(s) - 1)
+            if best is None or fp + fn < best[0]:
+                best = fp + fn, bands, rows
+    return best[1], best[2]
+
+
+class BloomFilter(object):
+    # 分块的布隆过滤器: 每个键只落在一个 64 位字里，置其中 k 位，查询和插入都只访问一个字
+
+    def __init__(self, capacity, error_rate):
+        bits_per_key = -math.log(error_rate) / math.log(2) ** 2
+        # 分块会让误判率略高，多给两成的位
+        self.words = 1 << max(6, math.ceil(math.log2(capacity * bits_per_key * 1.2 / 64)))
+        self.k = max(1, min(16, round(bits_per_key * math.log(2))))
+        self.capacity = capacity
+        self.count = 0
+        self.table = np.zeros(self.words, dtype=np.uint64)
+
+    def _locate(self, keys):
+        h = _mix(keys)
+        index = h & np.uint64(self.words - 1)
+        mask = np.zeros(len(keys), dtype=np.uint64)
+        h = _mix(h ^ np.uint64(0x9E3779B97F4A7C15))
+        for i in range(self.k):
+            mask |= np.uint64(1) << ((h >> np.uint64(6 * (i % 10))) & np.uint64(63))
+            if i % 10 == 9:
+                h = _mix(h)
+        return index, mask
+
+    def contains(self, keys):
+        index, mask = self._locate(keys)
+        return self.table[index] & mask == mask
+
+    def add(self, keys):
+        index, mask = self._locate(keys)
+        np.bitwise_or.at(self.table, index, mask)
+        self.count += len(keys)
+
+
+class ScalableBloomFilter(object):
+    # 装满后追加容量翻倍、误判率减半的新过滤器，总误判率不超过 2 * error_rate，内存随实际插入的键数增长
+
+    def __init__(self, capacity=1 << 20, error_rate=1e-5):
+        self.error_rate = error_rate
+        self.filters = [BloomFilter(capacity, error_rate / 2)]
+
+    def contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for f in self.filters:
+            found |= f.contains(keys)
+        return found
+
+    def add(self, keys):
+        last = self.filters[-1]
+        if last.count + len(keys) > last.capacity:
+            last = BloomFilter(last.capacity * 2, self.error_rate / 2 ** (len(self.filters) + 1))
+            self.filters.append(last)
+        last.add(keys)
+
+    @property
+    def nbytes(self):
+        return sum(f.table.nbytes for f in self.filters)
+
+
+class MinHashLSH(object):
+    # 按输入顺序流式去掉近似重复: 与之前保留的某个文本在任何一段签名上相同的文本视为重复。
+    # bands / rows: 直接指定分段，只给一个时另一个取 num_perm // 它；都不给时按 threshold 和 num_perm 选 (见 lsh_params)
+
+    def __init__(self, threshold=0.8, ngram=3, num_perm=64, seed=1, capacity=1 << 20, error_rate=1e-5, bands=None, rows=None):
+        self.ngram = ngram
+        if bands is None and rows is None:
+            bands, rows = lsh_params(threshold, num_perm)
+        elif bands is None:
+            bands = num_perm // rows
+        elif rows is None:
+            rows = num_perm // bands
+        if bands < 1 or rows < 1:
+            raise ValueError('bands and rows must be at least 1 (bands * rows <= num_perm when only one is given)')
+        self.bands, self.rows = bands, rows
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 64, size=self.bands * self.rows, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, size=self.bands * self.rows, dtype=np.uint64, endpoint=False)
+        self.seen = ScalableBloomFilter(capacity, error_rate)
+
+    def probability(self, s):
+        # Jaccard 相似度为 s 的文本被判为重复的概率 (不计布隆过滤器的误判)
+        return 1 - (1 - s ** self.rows) ** self.bands
+
+    def signatures(self, texts, batch_size=256):
+        # 每个文本的 MinHash 签名 (len(texts), bands * rows)
+        sigs = np.empty((len(texts), len(self.a)), dtype=np.uint32)
+        for lo in range(0, len(texts), batch_size):
+            part = texts[lo:lo + batch_size]
+            h, counts = ngram_hashes(part, self.ngram)
+            firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            # a * h + b (mod 2^64) 的高 32 位作为每个排列下的哈希值，逐个文本取最小
+            perm = ((h[None, :] * self.a[:, None] + self.b[:, None]) >> np.uint64(32)).astype(np.uint32)
+            sigs[lo:lo + len(part)] = np.minimum.reduceat(perm, firsts, axis=1).T
+        return sigs
+
+    def band_keys(self, sigs):
+        sigs = sigs.reshape(len(sigs), self.bands, self.rows).astype(np.uint64)
+        keys = np.arange(self.bands, dtype=np.uint64)[None, :] + np.zeros((len(sigs), 1), dtype=np.uint64)
+        for j in range(self.rows):
+            keys = keys * _PRIME + sigs[:, :, j]
+        return _mix(keys)
+
+    def add_batch(self, texts):
+        # 依次处理 texts，返回每个文本是否保留 (不与之前保留的文本近似重复)，保留的文本记入过滤器
+        if not texts:
+            return []
+        keys = self.band_keys(self.signatures(texts))
+        dup = self.seen.contains(keys.ravel()).reshape(keys.shape).any(axis=1)
+        # 这一批内部的碰撞: 只有与批内其它文本有相同段的文本需要按顺序逐个判定
+        _, inverse, counts = np.unique(keys.ravel(), return_inverse=True, return_counts=True)
+        involved = (counts[inverse] > 1).reshape(keys.shape).any(axis=1)
+        if involved.any():
+            kept = set()
+            for i in np.flatnonzero(involved):
+                band_keys = keys[i].tolist()
+                if dup[i] or any(k in kept for k in band_keys):
+                    dup[i] = True
+                else:
+                    kept.update(band_keys)
+        self.seen.add(keys[~dup].ravel())
+        return (~dup).tolist()
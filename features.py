@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 句子的字符统计特征，阈值规则 (句子长度、符号比例、数字字母比例、中日文比例) 共用。
+#
+# 一块句子组的所有句子拼在一起，经码位查表得到每个字符的类别，再用一次 bincount 数出每句各类字符的个数，
+# 结果是形状为 (句子组数, 侧数) 的 NumPy 结构化数组，各条规则在上面整块算出布尔掩码。
+# 同一块句子组依次经过多条规则时特征只计算一次 (见 features_of)。
+#
+#   python features.py c.zh c.ja -o feats.npy      # 规范化之后每个句子对的特征，供分析 (numpy.load 读取)
+
+import argparse
+import sys
+from string import ascii_letters, digits, punctuation
+
+import numpy as np
+
+
+# 字符类别表: 以码位为下标的查找表，把每个字符映射成一个类别字母。
+#   D: [0-9]   U: 其它 unicode 数字 (\d 还会匹配的部分)   L: [A-Za-z]
+#   / | -: 原样保留   P: 其它 ascii 标点   H: [一-龥]   K: [ぁ-んァ-ン]   空格: 其它字符
+def build_char_classes():
+    table = bytearray(b' ' * (sys.maxunicode + 1))
+    for code in range(sys.maxunicode + 1):
+        if chr(code).isdecimal():
+            table[code] = ord('U')
+    for c in punctuation:
+        table[ord(c)] = ord('P')
+    for c in '/|-':
+        table[ord(c)] = ord(c)
+    for c in ascii_letters:
+        table[ord(c)] = ord('L')
+    for c in digits:
+        table[ord(c)] = ord('D')
+    table[0x4e00:0x9fa6] = b'H' * (0x9fa6 - 0x4e00)
+    table[0x3041:0x3094] = b'K' * (0x3094 - 0x3041)
+    table[0x30a1:0x30f4] = b'K' * (0x30f4 - 0x30a1)
+    return table.decode('latin-1')
+
+
+CHAR_CLASSES = build_char_classes()
+
+# 每个类别字母对应的特征
+FEATURES = (('D', 'digit'), ('U', 'unidigit'), ('L', 'alpha'), ('/', 'slash'), ('|', 'pipe'), ('-', 'dash'),
+            ('P', 'punct'), ('H', 'han'), ('K', 'kana'))
+FEATURE_DTYPE = np.dtype([('len', '<i4')] + [(name, '<i4') for _, name in FEATURES])
+
+
+def build_class_index():
+    # 码位 -> 特征序号，不属于任何一类的字符为 len(FEATURES)
+    lut = np.full(256, len(FEATURES), dtype=np.uint8)
+    for i, (c, _) in enumerate(FEATURES):
+        lut[ord(c)] = i
+    return lut[np.frombuffer(CHAR_CLASSES.encode('latin-1'), dtype=np.uint8)]
+
+
+CLASS_INDEX = build_class_index()
+
+
+def sentence_features(sents):
+    n = len(sents)
+    feats = np.zeros(n, dtype=FEATURE_DTYPE)
+    lens = np.fromiter(map(len, sents), dtype=np.int64, count=n)
+    feats['len'] = lens
+    cps = np.frombuffer(''.join(sents).encode('utf-32-le'), dtype='<u4')
+    k = len(FEATURES) + 1
+    counts = np.bincount(np.repeat(np.arange(n) * k, lens) + CLASS_INDEX[cps], minlength=n * k).reshape(n, k)
+    for i, (_, name) in enumerate(FEATURES):
+        feats[name] = counts[:, i]
+    return feats
+
+
+def pair_features(items):
+    # items: 句子组的列表，返回 (len(items), 侧数) 的特征
+    sides = len(items[0]) if items else 1
+    return sentence_features([sent for sents in items for sent in sents]).reshape(len(items), sides)
+
+
+class FeatureCache(object):
+    # 记住最近一次计算过的一块句子组 (按对象身份) 及其特征。后面的规则拿到的是其中存活的部分，
+    # 通过的句子组还是同一个对象，直接按行取出即可；引用住这块句子组，保证 id 不会被新对象复用
+
+    def __init__(self):
+        self.items = None
+        self.rows = {}
+        self.feats = None
+
+    def clear(self):
+        self.__init__()
+
+    def get(self, items):
+        rows = self.rows
+        idx = [rows.get(id(sents), -1) for sents in items]
+        if self.feats is not None and -1 not in idx:
+            return self.feats[idx]
+        self.items = items
+        self.rows = {id(sents): i for i, sents in enumerate(items)}
+        self.feats = pair_features(items)
+        return self.feats
+
+
+_cache = FeatureCache()
+
+
+def features_of(items):
+    return _cache.get(items)
+
+
+def clear_features():
+    _cache.clear()
+
+
+def main():
+    from corpus import open_corpus
+    from text_norm import norm
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='one file per side, e.g. c.zh c.ja')
+    parser.add_argument('-o', '--output', required=True, help='.npy file of shape (lines, sides)')
+    parser.add_argument('--chunk_size', type=int, default=100000)
+    args = parser.parse_args()
+
+    fs = [open_corpus(path) for path in args.files]
+    parts = []
+    chunk = []
+    for sents in zip(*fs):
+        chunk.append(tuple(map(norm, sents)))
+        if len(chunk) == args.chunk_size:
+            parts.append(pair_features(chunk))
+            chunk = []
+    if chunk or not parts:
+        parts.append(pair_features(chunk) if chunk else np.zeros((0, len(fs)), dtype=FEATURE_DTYPE))
+    for f in fs:
+        f.close()
+    np.save(args.output, np.concatenate(parts))
+
+
+if __name__ == '__main__':
+    main()
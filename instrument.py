@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 规则级别的计时与内存统计。
+#
+# RuleChain 带上 RuleStats 时，每块句子组按规则依次整块执行 (而不是逐句走完所有规则)，
+# 这样每条规则的耗时和峰值内存 (ru_maxrss) 的增长都能单独记下来；判定结果和不统计时完全相同。
+# 多进程时各个子进程的统计随结果一起传回主进程累加，耗时是所有进程的合计。
+# 打开 profile 时每条规则最先处理的若干行在 cProfile 下执行，这部分耗时也包含了 cProfile 本身的开销。
+
+import cProfile
+import csv
+import json
+import pstats
+import sys
+import time
+
+
+def peak_rss():
+    # 当前进程的峰值常驻内存，单位 KB (Linux 下 ru_maxrss 即为 KB)。
+    # resource 只在类 Unix 系统上有，其它平台 (Windows) 记为 0，清洗脚本不带 --stats 时也能照常导入
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RuleStats(object):
+
+    def __init__(self, n_rules, profile_lines=0):
+        self.start_rss = peak_rss()
+        self.seconds = [0.0] * n_rules
+        self.rss = [0] * n_rules
+        # 每条规则最先收到的 profile_lines 行在 cProfile 下执行，供 profile_slowest 使用
+        self.profile_lines = profile_lines
+        self.profiled = [0] * n_rules
+        self.profiles = [[] for _ in range(n_rules)]
+
+    def run(self, i, fn, items):
+        profiler = None
+        if self.profiled[i] < self.profile_lines:
+            profiler = cProfile.Profile()
+            self.profiled[i] += len(items)
+        rss = peak_rss()
+        start = time.perf_counter()
+        outs = fn(items) if profiler is None else profiler.runcall(fn, items)
+        self.seconds[i] += time.perf_counter() - start
+        self.rss[i] += peak_rss() - rss
+        if profiler is not None:
+            # 只保留可以 pickle 的统计结果，多进程时随结果传回主进程
+            profiler.create_stats()
+            self.profiles[i].append(profiler.stats)
+        return outs
+
+    def merge(self, other):
+        for i in range(len(self.seconds)):
+            self.seconds[i] += other.seconds[i]
+            self.rss[i] += other.rss[i]
+            if self.profiled[i] < self.profile_lines:
+                self.profiled[i] += other.profiled[i]
+                self.profiles[i] += other.profiles[i]
+        return self
+
+
+class _ProfileStats(object):
+    # 让 pstats.Stats 直接读取 create_stats 之后的统计字典
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def stats_rows(chain, wall):
+    # 每条规则一行: 进出的句子数、过滤比例、耗时、吞吐量和峰值内存增长
+    rows = []
+    remain = chain.total
+    for i, (rule, n) in enumerate(zip(chain.rules, chain.rejected)):
+        seconds = chain.stats.seconds[i]
+        rows.append({
+            'rule': type(rule).__name__,
+            'lines_in': remain,
+            'lines_out': remain - n,
+            'rejected': n,
+            'rejection_rate': round(n / remain, 6) if remain else 0.0,
+            'seconds': round(seconds, 6),
+            'lines_per_s': round(remain / seconds, 1) if seconds else None,
+            'peak_rss_delta_kb': chain.stats.rss[i],
+        })
+        remain -= n
+    rows.append({
+        'rule': 'total',
+        'lines_in': chain.total,
+        'lines_out': remain,
+        'rejected': chain.total - remain,
+        'rejection_rate': round((chain.total - remain) / chain.total, 6) if chain.total else 0.0,
+        'seconds': round(wall, 6),
+        'lines_per_s': round(chain.total / wall, 1) if wall else None,
+        'peak_rss_delta_kb': peak_rss() - chain.stats.start_rss,
+    })
+    return rows
+
+
+def write_stats(chain, wall, path):
+    # 按扩展名写 CSV 或 JSON；总计一行的 peak_rss_delta_kb 是主进程在整个运行期间的峰值内存增长
+    rows = stats_rows(chain, wall)
+    with open(path, 'w', encoding='utf8', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+            f.write('\n')
+
+
+def profile_slowest(chain, path, file=sys.stderr):
+    # 把最慢的规则在 cProfile 下处理最先若干行的统计存到 path (可用 python -m pstats 或 snakeviz 查看)，并打印最耗时的函数
+    stats = chain.stats
+    candidates = [i for i in range(len(chain.rules)) if stats.profiles[i]]
+    if not candidates:
+        return
+    i = max(candidates, key=lambda i: stats.seconds[i])
+    profile = pstats.Stats(*[_ProfileStats(dict(p)) for p in stats.profiles[i]], stream=file)
+    profile.dump_stats(path)
+    print('Profiled %s on its first %i lines, saved to %s' % (type(chain.rules[i]).__name__, stats.profiled[i], path),
+          file=file)
+    profile.sort_stats('cumulative').print_stats(15)
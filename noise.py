@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# addnoise.py 的整块加噪: 一串可组合的噪声算子依次作用在一块句子上。
+#
+# 一块句子按空白切词后编码成词 id (Batch): 所有句子的词 id 依次排在一个数组里，另有每个词所属的句子，
+# 算子只在这些整数数组上整块操作 (排序键、掩码、repeat)，最后才换回字符串。算子 (OPERATORS) 有:
+#   shuffle:     第 i 个词的排序键为 i + U(0, 1) * k，按键排序 (每个词最多移动 k - 1 个位置)
+#   dropout:     每个词以概率 p 删除，全部删掉时随机保留一个
+#   bpe_dropout: 同 dropout，但以整词为单位: 以 @@ 结尾的子词和它后面的子词一起保留或删除
+#   blank:       每个词以概率 p 换成 token (默认 Ж)
+#   char_swap:   相邻的两个中日韩单字以概率 p 交换 (输入按字切分，如 postedit.py 的输出)
+#   span_mask:   每个位置以概率 p 开始一段平均长 mean 的片段 (几何分布)，整段换成一个 token
+#   insert:      每个词后面以概率 p 插入一个词: 给出 vocab 文件 (每行一个词，可带第二列的频数) 时按频数抽取，
+#                否则从同一句里随机抄一个词
+# 默认的 shuffle:k=3 dropout:p=0.1 blank:p=0.1 与逐句调用 torch 的 word_shuffle / word_dropout / word_blank 同分布。
+#
+# 随机数按行派生: 第 i 行第 j 个随机数是 splitmix64 作用在 (seed, i, 随机流, j) 组成的计数器上的结果 (基于计数器的生成器)，
+# 只取决于种子和行号，与分块以及由哪个进程处理无关，所以同一种子的输出总是相同，多进程并行也逐字节一致。
+# 每个算子按在流程里的位置占用自己的几路随机流；j 是词的位置 (slot): 改变顺序或插入词的算子之后重新编号，
+# 删除不重新编号。
+
+import json
+from itertools import count
+
+import numpy as np
+
+BLANK = 'Ж'
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def splitmix64(x):
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def random_seed():
+    return int(np.random.SeedSequence().entropy) & ((1 << 64) - 1)
+
+
+class LineRandom(object):
+    # 一块句子的随机数: lines 为每句的行号，streams 为每行的随机流总数
+
+    def __init__(self, seed, lines, streams):
+        self.seed = np.uint64(seed)
+        self.lines = lines.astype(np.uint64)
+        self.streams = np.uint64(streams)
+
+    def uniform(self, lines, stream, slots):
+        # 行号为 lines 的各行在第 stream 路上第 slots 个 [0, 1) 均匀随机数
+        with np.errstate(over='ignore'):
+            keys = splitmix64(self.seed + (lines * self.streams + np.uint64(stream)) * GOLDEN)
+            x = splitmix64(keys + (slots.astype(np.uint64) + np.uint64(1)) * GOLDEN)
+        return (x >> np.uint64(11)) * (1.0 / (1 << 53))
+
+    def tokens(self, batch, stream):
+        # 每个词一个
+        return self.uniform(self.lines[batch.sent], stream, batch.slot)
+
+    def sentences(self, stream):
+        # 每句一个
+        return self.uniform(self.lines, stream, np.zeros(len(self.lines), dtype=np.int64))
+
+
+class Vocab(object):
+    # 一块句子里出现的词 <-> id，算子用到的新词 (Ж、插入的词) 按需加入
+
+    def __init__(self):
+        self.index = {}
+        self.words = []
+
+    def encode(self, words):
+        index = self.index
+        new = [w for w in dict.fromkeys(words) if w not in index]
+        index.update(zip(new, count(len(self.words))))
+        self.words.extend(new)
+        return np.fromiter(map(index.__getitem__, words), dtype=np.int64, count=len(words))
+
+    def id(self, word):
+        return self.encode([word])[0]
+
+    def flags(self, predicate):
+        # 每个词 id 是否满足 predicate
+        return np.fromiter(map(predicate, self.words), dtype=bool, count=len(self.words))
+
+
+class Batch(object):
+    # ids: 所有句子的词 id 依次排列；sent: 每个词所属的句子 (非降)；slot: 每个词取随机数用的位置；n: 句子数
+
+    def __init__(self, ids, sent, slot, n):
+        self.ids = ids
+        self.sent = sent
+        self.slot = slot
+        self.n = n
+
+    @classmethod
+    def encode(cls, sents, vocab):
+        lens = np.fromiter(map(len, sents), dtype=np.int64, count=len(sents))
+        ids = vocab.encode([w for words in sents for w in words])
+        sent = np.repeat(np.arange(len(sents)), lens)
+        batch = cls(ids, sent, None, len(sents))
+        batch.slot = batch.positions()
+        return batch
+
+    def lengths(self):
+        return np.bincount(self.sent, minlength=self.n)
+
+    def starts(self):
+        lens = self.lengths()
+        return np.cumsum(lens) - lens
+
+    def positions(self):
+        # 每个词在句子里的位置
+        return np.arange(len(self.ids)) - self.starts()[self.sent]
+
+    def first(self):
+        # 每个词是否是句子的第一个词
+        return np.concatenate(([True], self.sent[1:] != self.sent[:-1])) if len(self.sent) else np.zeros(0, bool)
+
+    def take(self, idx, renumber=False):
+        batch = Batch(self.ids[idx], self.sent[idx], self.slot[idx], self.n)
+        if renumber:
+            batch.slot = batch.positions()
+        return batch
+
+    def decode(self, vocab):
+        words = list(map(vocab.words.__getitem__, self.ids.tolist()))
+        out = []
+        start = 0
+        for end in np.cumsum(self.lengths()).tolist():
+            out.append(' '.join(words[start:end]))
+            start = end
+        return out
+
+
+class Operator(object):
+    # name: 流程里的名字；streams: 每行占用的随机流数
+    # __call__(batch, vocab, rand, stream) 返回新的 Batch，stream 是这个算子的第一路随机流
+    name = None
+    streams = 1
+
+
+class Shuffle(Operator):
+    name = 'shuffle'
+
+    def __init__(self, k=3):
+        self.k = k
+
+    def __call__(self, batch, vocab, rand, stream):
+        # 句子之间的间隔大于任何排序键，一次排序即可
+        keys = batch.positions() + rand.tokens(batch, stream) * self.k
+        width = batch.lengths().max(initial=0) + self.k + 1
+        return batch.take(np.argsort(batch.sent * width + keys), renumber=True)
+
+
+class Dropout(Operator):
+    name = 'dropout'
+    streams = 2
+
+    def __init__(self, p=0.1):
+        self.p = p
+
+    def units(self, batch, vocab):
+        # 一起删除的单位: 每个词开始一个新单位
+        return np.ones(len(batch.ids), dtype=bool)
+
+    def __call__(self, batch, vocab, rand, stream):
+        heads = self.units(batch, vocab)
+        unit = np.cumsum(heads) - 1
+        head_pos = np.flatnonzero(heads)
+        keep_unit = rand.tokens(batch, stream)[head_pos] > self.p
+        # 全部删掉的句子随机保留一个单位
+        unit_sent = batch.sent[head_pos]
+        kept = np.bincount(unit_sent[keep_unit], minlength=batch.n)
+        counts = np.bincount(unit_sent, minlength=batch.n)
+        dropped = np.flatnonzero((kept == 0) & (counts > 0))
+        if len(dropped):
+            pick = (rand.sentences(stream + 1)[dropped] * counts[dropped]).astype(np.int64)
+            keep_unit[(np.cumsum(counts) - counts)[dropped] + pick] = True
+        return batch.take(np.flatnonzero(keep_unit[unit]))
+
+
+class BpeDropout(Dropout):
+    name = 'bpe_dropout'
+
+    def __init__(self, p=0.1, marker='@@'):
+        self.p = p
+        self.marker = marker
+
+    def units(self, batch, vocab):
+        # 前一个子词以 @@ 结尾时接着前一个词，不开始新单位
+        cont = vocab.flags(lambda w: w.endswith(self.marker))[batch.ids]
+        heads = batch.first()
+        heads[1:] |= ~cont[:-1]
+        return heads
+
+
+class Blank(Operator):
+    name = 'blank'
+
+    def __init__(self, p=0.1, token=BLANK):
+        self.p = p
+        self.token = token
+
+    def __call__(self, batch, vocab, rand, stream):
+        ids = batch.ids.copy()
+        ids[rand.tokens(batch, stream) <= self.p] = vocab.id(self.token)
+        return Batch(ids, batch.sent, batch.slot, batch.n)
+
+
+def is_cjk(word):
+    # 假名、汉字 (含扩展 A 和兼容汉字)、韩文音节的单字
+    return len(word) == 1 and ('\u3040' <= word <= '\u30ff' or '\u3400' <= word <= '\u9fff'
+                               or '\uac00' <= word <= '\ud7a3' or '\uf900' <= word <= '\ufaff')
+
+
+class CharSwap(Operator):
+    name = 'char_swap'
+
+    def __init__(self, p=0.1):
+        self.p = p
+
+    def __call__(self, batch, vocab, rand, stream):
+        cjk = vocab.flags(is_cjk)[batch.ids]
+        # 第 i 个词和第 i + 1 个词交换: 两个都是单字且在同一句；与前一处交换重叠时放弃
+        cand = np.zeros(len(batch.ids), dtype=bool)
+        cand[:-1] = cjk[:-1] & cjk[1:] & (batch.sent[:-1] == batch.sent[1:])
+        cand &= rand.tokens(batch, stream) < self.p
+        cand[1:] &= ~cand[:-1]
+        order = np.arange(len(batch.ids))
+        i = np.flatnonzero(cand)
+        order[i], order[i + 1] = i + 1, i
+        return batch.take(order, renumber=True)
+
+
+class SpanMask(Operator):
+    name = 'span_mask'
+    streams = 2
+
+    def __init__(self, p=0.05, mean=3, token=BLANK):
+        self.p = p
+        self.mean = mean
+        self.token = token
+
+    def __call__(self, batch, vocab, rand, stream):
+        starts = np.flatnonzero(rand.tokens(batch, stream) < self.p)
+        if not len(starts):
+            return batch
+        # 片段长度服从均值为 mean 的几何分布，不超过句末
+        u = rand.tokens(batch, stream + 1)[starts]
+        q = 1 - 1 / self.mean
+        lens = 1 + (np.floor(np.log1p(-u) / np.log(q)).astype(np.int64) if q > 0 else 0)
+        ends = np.minimum(starts + lens, np.cumsum(batch.lengths())[batch.sent[starts]])
+        depth = np.zeros(len(batch.ids) + 1, dtype=np.int64)
+        np.add.at(depth, starts, 1)
+        np.add.at(depth, ends, -1)
+        masked = np.cumsum(depth[:-1]) > 0
+        # 连续被遮住的词只留第一个，换成 token
+        run_head = masked & (batch.first() | ~np.concatenate(([False], masked[:-1])))
+        batch = Batch(np.where(run_head, vocab.id(self.token), batch.ids), batch.sent, batch.slot, batch.n)
+        return batch.take(np.flatnonzero(~masked | run_head), renumber=True)
+
+
+class Insert(Operator):
+    name = 'insert'
+    streams = 2
+
+    def __init__(self, p=0.1, vocab=None):
+        self.p = p
+        self.vocab = vocab
+        self.words = None
+        if vocab is not None:
+            words, weights = [], []
+            with open(vocab, encoding='utf8') as f:
+                for line in f:
+                    fields = line.split()
+                    if fields:
+                        words.append(fields[0])
+                        weights.append(float(fields[1]) if len(fields) > 1 else 1.0)
+            self.words = words
+            self.cum = np.cumsum(weights) / sum(weights)
+
+    def __call__(self, batch, vocab, rand, stream):
+        ins = rand.tokens(batch, stream) < self.p
+        if not ins.any():
+            return batch
+        u = rand.tokens(batch, stream + 1)[ins]
+        if self.words is not None:
+            choice = np.minimum(np.searchsorted(self.cum, u, side='right'), len(self.words) - 1)
+            # 只把抽中的词加入这一块的词表
+            picked, inverse = np.unique(choice, return_inverse=True)
+            new_ids = vocab.encode([self.words[i] for i in picked.tolist()])[inverse]
+        else:
+            # 从同一句里抄一个词
+            lens = batch.lengths()[batch.sent[ins]]
+            src = batch.starts()[batch.sent[ins]] + (u * lens).astype(np.int64)
+            new_ids = batch.ids[src]
+        counts = 1 + ins.astype(np.int64)
+        ids = np.repeat(batch.ids, counts)
+        ids[(np.cumsum(counts) - 1)[ins]] = new_ids
+        sent = np.repeat(batch.sent, counts)
+        out = Batch(ids, sent, None, batch.n)
+        out.slot = out.positions()
+        return out
+
+
+OPERATORS = {cls.name: cls for cls in (Shuffle, Dropout, BpeDropout, Blank, CharSwap, SpanMask, Insert)}
+
+
+def parse_operator(spec):
+    # name 或 name:key=value,key=value；value 按 JSON 解析，解析不了时当作字符串
+    name, _, args = spec.partition(':')
+    if name not in OPERATORS:
+        raise ValueError('unknown noise operator %r, expected one of %s' % (name, ', '.join(OPERATORS)))
+    params = {}
+    for item in filter(None, args.split(',')):
+        key, value = item.split('=', 1)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        params[key] = value
+    return OPERATORS[name](**params)
+
+
+def default_operators(sk=3, wd=0.1, wb=0.1):
+    return [Shuffle(sk), Dropout(wd), Blank(wb)]
+
+
+class NoisePipeline(object):
+
+    def __init__(self, operators):
+        self.operators = operators
+        self.offsets = np.cumsum([0] + [op.streams for op in operators])
+        # 每行的随机流总数，至少为 4
+        self.streams = max(4, int(self.offsets[-1]))
+
+    def __call__(self, lines, seed=None, start=0):
+        # lines: 一块句子 (按空白切词)，start: 第一句的行号，返回加噪后的句子，顺序不变；空行仍为空行。
+        # 不给 seed 时随机取一个
+        return self.variants(lines, [random_seed() if seed is None else seed], start)[0]
+
+    def variants(self, lines, seeds, start=0):
+        # 每个种子一份加噪结果，句子只切词、编码一次 (算子不修改传入的 Batch)
+        vocab = Vocab()
+        batch = Batch.encode([line.split() for line in lines], vocab)
+        line_ids = np.arange(start, start + len(lines))
+        outs = []
+        for seed in seeds:
+            rand = LineRandom(seed, line_ids, self.streams)
+            noised = batch
+            for op, stream in zip(self.operators, self.offsets.tolist()):
+                noised = op(noised, vocab, rand, stream)
+            outs.append(noised.decode(vocab))
+        return outs
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 规则注册表与声明式的清洗流程，preprocess.py / preprocess_with_trash.py / preprocess_mono.py 共用。
+#
+# 流程用 JSON (或安装了 PyYAML 时用 YAML) 描述，默认的流程见 pipelines/pair.json 和 pipelines/mono.json:
+#   mode:    pair 为 (src, tgt) 句子对，mono 为单语
+#   langs:   每一侧期望的语言，mono 时只有一个 (不写则用命令行给出的语言)
+#   reorder: 大于 0 时先在输入的前这么多行上测量各规则的过滤比例，再结合各规则的估计耗时调整规则顺序 (见 reorder_rules)
+#   rules:   按顺序执行的规则，可以只写名字，也可以写成 {"name": 名字, 参数: 值, ...}，参数即对应规则类的构造参数
+
+import json
+import os
+
+from clean_rules import (Norm, DupRemove, ExternalDupRemove, NearDupRemove, ContaminationRemove, SrcTgtSameRemove,
+                         SentenceLenRemove, SpPuncRemove, SpCharRemove, PuncRatioRemove, NumAlpRatioRemove,
+                         StNumAlpRatioRemove, HtmlRemove, XRemove, ScriptRatioRemove, EmojiRemove, LangidRemove, ZH_CHARS,
+                         JA_CHARS, _take_counters)
+
+# 名字 (Rule.name) 沿用原先各个 xxx_remove 函数
+RULES = {cls.name: cls for cls in (Norm, DupRemove, NearDupRemove, ContaminationRemove, SrcTgtSameRemove,
+                                   SentenceLenRemove, SpPuncRemove, SpCharRemove, PuncRatioRemove, NumAlpRatioRemove,
+                                   StNumAlpRatioRemove, HtmlRemove, XRemove, ScriptRatioRemove, EmojiRemove, LangidRemove)}
+
+# 这些规则过滤掉的句子对放入垃圾箱，等待回收 (见 preprocess_with_trash.py 和 recycle.py)
+TRASH_RULES = {'sentence_len_remove', 'numalp_ratio_remove', 'st_numalp_ratio_remove', 'emoji_remove', 'langid_remove'}
+
+# 只对句子对有意义的规则
+PAIR_ONLY = {'src_tgt_same_remove', 'st_numalp_ratio_remove'}
+
+# script_ratio_remove 能检查的语言，其它语言跳过这条规则
+SCRIPTS = {'zh': ZH_CHARS, 'ja': JA_CHARS}
+MONO_SCRIPT_MSGS = {
+    'zh': 'After removing sentences with less chinese character, remain %i pairs',
+    'ja': 'After removing sentences with less japanese character, remain %i pairs',
+}
+
+PIPELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipelines')
+
+
+def load_pipeline(path):
+    with open(path, encoding='utf8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def default_pipeline(mode):
+    return load_pipeline(os.path.join(PIPELINES_DIR, mode + '.json'))
+
+
+def build_rules(spec, mode, overrides=None):
+    # overrides: {规则名: {参数: 值}}，命令行上给出的参数覆盖流程里的同名参数
+    # 每条规则的 entry 记下它实际使用的参数 (合并了 overrides 和按语言补全的参数)，见 resolved_pipeline
+    if spec.get('mode', 'pair') != mode:
+        raise ValueError('pipeline is for %s corpora, not %s' % (spec.get('mode', 'pair'), mode))
+    langs = tuple(spec['langs'])
+    rules = []
+    for entry in spec['rules']:
+        params = {'name': entry} if isinstance(entry, str) else dict(entry)
+        name = params.pop('name')
+        if name not in RULES:
+            raise ValueError('unknown rule in pipeline: %s' % name)
+        if mode == 'mono' and name in PAIR_ONLY:
+            raise ValueError('%s only applies to sentence pairs' % name)
+        params.update((overrides or {}).get(name, {}))
+        if name == 'script_ratio_remove':
+            if 'scripts' not in params:
+                if not all(lang in SCRIPTS for lang in langs):
+                    continue
+                params['scripts'] = tuple(SCRIPTS[lang] for lang in langs)
+            if mode == 'mono' and langs[0] in MONO_SCRIPT_MSGS:
+                params.setdefault('msg', MONO_SCRIPT_MSGS[langs[0]])
+            params['scripts'] = tuple(params['scripts'])
+        if name == 'langid_remove':
+            params['langs'] = tuple(params.get('langs', langs))
+        rule = RULES[name](**params)
+        rule.entry = dict(params, name=name)
+        rules.append(rule)
+    return rules
+
+
+def use_external_dedup(rules, items, tmp_dir=None):
+    # 把 dup_remove 换成 ExternalDupRemove: 先把 items (整个输入) 扫一遍，经过排在它前面的规则后找出所有重复的句子组，
+    # 去重表不占内存。流程里没有 dup_remove 时原样返回
+    names = [rule.name for rule in rules]
+    if 'dup_remove' not in names:
+        return rules
+    k = names.index('dup_remove')
+    dedup = ExternalDupRemove.from_items(items, rules[:k], rules[k].digest_size, tmp_dir)
+    dedup.entry = rules[k].entry
+    return rules[:k] + [dedup] + rules[k + 1:]
+
+
+def resolved_pipeline(spec, rules):
+    # 这串规则 (按实际的执行顺序) 对应的流程描述，交给 build_rules 能重建同样的规则，不再调整顺序；
+    # 垃圾箱记下它，回收时用 (见 trash_bin.py 和 recycle.py)
+    return {'mode': spec.get('mode', 'pair'), 'langs': list(spec['langs']),
+            'rules': [dict(rule.entry) for rule in rules]}
+
+
+def movable(rule):
+    return not (rule.stateful or rule.rewrites or rule.passive)
+
+
+# 在样本上测量每条规则单独执行时的过滤比例，然后在不改写句子的无状态规则之间调整顺序，
+# 让便宜 (Rule.cost) 且过滤得多的规则排在前面，少让句子走到昂贵的规则 (如 langid)。
+# 耗时用固定的估计值而不是现场计时，同样的样本总是给出同样的顺序，判定缓存 (版本里含规则顺序) 和垃圾箱的归属才稳定。
+# 这些规则的判定互不依赖，保留下来的句子对不变，但日志里每条规则过滤掉的数量和垃圾箱的内容会随顺序变化。
+# 有状态的规则 (去重)、会改写句子的规则 (norm, soft html) 和只统计的规则 (flag 模式的 contamination_remove) 不移动，
+# 样本也不经过有状态和只统计的规则，以免改变它们的状态；
+# 样本上累加的计数 (如 soft html 删掉的字符数) 最后清零，不计入日志。
+def reorder_rules(rules, sample):
+    items = [tuple(sents) for sents in sample]
+    ordered = []
+    i = 0
+    while i < len(rules):
+        if not movable(rules[i]):
+            if not (rules[i].stateful or rules[i].passive):
+                items = [out for out in rules[i].batch(items) if out is not None]
+            ordered.append(rules[i])
+            i += 1
+            continue
+        j = i
+        while j < len(rules) and movable(rules[j]):
+            j += 1
+        keys = {}
+        passed = [True] * len(items)
+        for k in range(i, j):
+            outs = rules[k].batch(items)
+            rejected = sum(out is None for out in outs)
+            # 规则相互独立时，按 耗时 / 过滤比例 从小到大执行，期望总耗时最小；不过滤任何样本的规则放到最后，
+            # 相同时保持流程里的顺序
+            keys[k] = rules[k].cost * len(items) / rejected if rejected else float('inf')
+            passed = [p and out is not None for p, out in zip(passed, outs)]
+        items = [sents for sents, p in zip(items, passed) if p]
+        ordered.extend(rules[k] for k in sorted(range(i, j), key=lambda k: keys[k]))
+        i = j
+    _take_counters(list(enumerate(ordered)))
+    return ordered
+
+
+def insert_rule(spec, name, **params):
+    # 在 dup_remove 之后加入一条规则，流程里已经有这条规则时只修改参数；值为 None 的参数不写入。
+    # 没有 dup_remove 时加在开头的 norm / html_remove 之后: 近似去重和留出集检查都要看到改写完的最终文本
+    entry = dict({k: v for k, v in params.items() if v is not None}, name=name)
+    names = [rule if isinstance(rule, str) else rule['name'] for rule in spec['rules']]
+    if name in names:
+        i = names.index(name)
+        old = spec['rules'][i]
+        spec['rules'][i] = dict({} if isinstance(old, str) else old, **entry)
+        return spec
+    if 'dup_remove' in names:
+        pos = names.index('dup_remove') + 1
+    else:
+        pos = 0
+        while pos < len(names) and names[pos] in ('norm', 'html_remove'):
+            pos += 1
+    spec['rules'].insert(pos, entry)
+    return spec
+
+
+def overrides_from_args(args):
+    # 三个清洗脚本共有的命令行参数，只有显式给出的才覆盖流程里的设置
+    overrides = {}
+    if args.soft_html is not None:
+        overrides['html_remove'] = {'soft': args.soft_html}
+    langid_args = dict(candidates=args.langid_langs, threshold=args.langid_threshold, cache_size=args.langid_cache,
+                       shortcut=args.langid_shortcut or None)
+    overrides['langid_remove'] = {k: v for k, v in langid_args.items() if v is not None}
+    return overrides
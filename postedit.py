@@ -5,6 +5,8 @@ import argparse
 import sys
 import string
 
+from corpus import line_blocks
+
 HALF_MIN = 0x0020
 HALF_MAX = 0x7e
 FULL_MIN = HALF_MIN + 0xfee0
@@ -34,9 +36,10 @@ def check_char(char, char_set):
 
 
 def process(opt, lines):
+    # 逐行给出处理后的句子
     for line in lines:
         if line.strip() == '' or line.strip() == 'X':
-            print(line)
+            yield line
             continue
 
         chars = [c for c in list(line) if c.strip()]
@@ -75,7 +78,7 @@ def process(opt, lines):
             if chars[0] in PERIODS:
                 chars = chars[1:]
 
-        print(' '.join(chars))
+        yield ' '.join(chars)
 
 
 def main():
@@ -86,10 +89,16 @@ def main():
     parser.add_argument('--remove-period', default=False, action='store_true',
                         help='Remove all periods in file if specified.')
 
-    opt = parser.parse_args()
-    lines = sys.stdin.read().split('\n')
+    parser.add_argument('--input', default=None,
+                        help='read this file (memory-mapped or decompressed in the background, see corpus.py) instead of stdin')
 
-    process(opt, lines)
+    opt = parser.parse_args()
+    # 边读边处理，每块整块写出并 flush，下游马上能拿到
+    out = sys.stdout.buffer
+    for block in line_blocks(opt.input):
+        if block:
+            out.write(('\n'.join(process(opt, block)) + '\n').encode('utf8'))
+            out.flush()
 
 
 if __name__ == '__main__':
@@ -1,254 +1,89 @@
 import sys
-import re
 import argparse
-from string import punctuation
-import langid
-import unicodedata
-
-parser = argparse.ArgumentParser()
-parser.add_argument('src', help='source file')
-parser.add_argument('lang', help='language')
-parser.add_argument('--soft_html', action='store_true', default=False, help='whether to use soft version only to remove html tag, not the sentence')
-args = parser.parse_args()
-
-f1 = args.src
-lang = args.lang
-
-min_tok = 3
-max_top = 100
-punc_max_num = 10
-
-# 预处理
-def norm(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = unicodedata.normalize('NFKC',x.strip()).replace(" ", "")
-    x = re.sub('[\u200D\uFEFF\u200b\u00AD\u202C\u202D\u200C\u202A\u200E\uFDD3]', '', x.strip(), flags=re.MULTILINE)
-    x_out.append(x.strip())
-
-  print('After norm, remain %i pairs' % len(x_out))
-  return x_out
-
-
-def dup_remove(x_in):
-  all_lines = [x.strip() for x in x_in]
-  x_out = set(all_lines)  # make as set
-
-  print('After removing duplicated sentences, remain %i pairs' % len(x_out))
-  return x_out
-
-def sentence_len_remove(x_in):
-
-  def check_word_num(sent):
-    segs = sent.strip()
-    if len(segs) < min_tok or len(segs) > max_top:
-      return False
-    return True
-
-  x_out = []
-
-  for x in x_in:
-    if check_word_num(x):
-      x_out.append(x.strip())
-
-  print('After removing sentences with too less or too many words, reamin %i pairs' % len(x_out))
-  return x_out
-
-def sp_punc_remove(x_in):
-
-  def hot_fix_filter(sent):
-    sent = sent.strip()
-    if sent.count("/")  > 5:
-      return False
-    if sent.count("|") > 5:
-      return False 
-    if sent.count("-") > 5:
-      return False
-    if len(re.findall("[\d\-\|/]", sent)) / len(sent) > 0.5:
-      return False
-    return True
-
-  x_out = []
-
-  for x in x_in:
-    if hot_fix_filter(x):
-      x_out.append(x.strip())
-
-  print('After removing sentences with too many specific punctuations, reamin %i pairs' % len(x_out))
-  return x_out
-
-# 去掉有特殊字符的句子
-def sp_char_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    if r"\x" in x or u'\xa0' in x or u'\u3000' in x or '▅' in x :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with special characters, remain %i pairs' % len(x_out))
-  return x_out
-
-def punc_ratio_remove(x_in):
-  x_out = []
-
-  count_func = lambda l1,l2: sum([1 for x in l1 if x in l2])
-
-  punctuation_set = set(punctuation)
-  for x in x_in:
-    m_punc_x = count_func(x.strip(), set(punctuation_set))
-    if m_punc_x / (len(x.strip()) + 1e-9) > 0.5 or m_punc_x > punc_max_num:
-      continue
-    x_out.append(x.strip()) 
-
-  print('After removing sentences with too much punctuations, remain %i pairs' % len(x_out))
-  return x_out
-
-# 去掉太多字母 太多数字的句子
-def numalp_ratio_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = x.strip()
-    if re.findall(r"\d{8}", x) or re.findall(r"[A-Za-z0-9]{15}", x) or len(re.findall(r"[A-Za-z0-9]{1}", x))/len(x) > 0.5 :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with much numbers or alp, remain %i pairs' % len(x_out))
-  return x_out
-
-def html_remove(x_in):
-  x_out = []
-
-  def filter_by_html(sentence):
-    sen = sentence.strip()
-    detector = re.compile('<.*?>')
-    html_tag = re.findall(detector, sen)
-    if html_tag or 'https://' in sen or 'http://' in sen:
-      return False
-    return True
-
-  def soft_filter_by_html(sent):
-    sent = sent.strip()
-    detector = re.compile('<.*?>')
-    sent = re.sub(detector, '', sent)
-    sent = re.sub('https?:\/\/.*[ \r\n]', '', x, flags=re.MULTILINE)
-    return sent
-
-  for x in x_in:
-    if args.soft_html:
-      x_out.append(soft_filter_by_html(x))
-    else:
-      if filter_by_html(x):
-        x_out.append(x.strip())
-
-  print('After removing sentences with html address or tags, remain %i pairs' % len(x_out))
-  return x_out
-
-#去掉1111x1111
-def x_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = x.strip()
-    if re.findall(r"[0-9]{3,4}x[0-9]{3,4}", x)  :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with 1111x1111, remain %i pairs' % len(x_out))
-  return x_out
-
-
-def nonchinese_ratio_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = x.strip()
-    if len(re.findall("[\u4e00-\u9fa5]", x))/len(x) < 0.5  :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with less chinese character, remain %i pairs' % len(x_out))
-  return x_out
-
-def nonjapanese_ratio_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = x.strip()
-    if len(re.findall(u"[ぁ-んァ-ン一-龥]", x))/len(x) < 0.5  :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with less japanese character, remain %i pairs' % len(x_out))
-  return x_out
-
-
-#emoji
-def emoji_remove(x_in):
-  x_out = []
-  emoj = re.compile("["
-                       u"\U0001F600-\U0001F64F"  # emoticons
-                       u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                       u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                       u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                       "]+", flags=re.UNICODE )
-  
-  for x in x_in:
-    x = x.strip()
-    if re.findall(emoj,x) :
-      continue
-    x_out.append(x.strip())
-    
-  print('After removing sentences with emoji, remain %i pairs' % len(x_out))
-  return x_out
-
-def langid_remove(x_in):
-  x_out = []
-
-  for x in x_in:
-    x = x.strip()
-    if langid.classify(x)[0] != lang :
-      continue
-    x_out.append(x.strip())
-
-  print('After removing sentences with other language, remain %i pairs' % len(x_out))
-  return x_out
-
-filter_1 = []
-
-fr_1 = open(f1, "r", encoding="utf8") 
-
-f1_all_lines = fr_1.readlines()
-
-filter_1 = norm(f1_all_lines)
-filter_1 = dup_remove(filter_1)
-filter_1 = sentence_len_remove(filter_1)
-filter_1 = sp_punc_remove(filter_1)
-filter_1 = sp_char_remove(filter_1)
-filter_1 = punc_ratio_remove(filter_1)
-filter_1 = numalp_ratio_remove(filter_1)
-filter_1 = html_remove(filter_1)
-filter_1 = x_remove(filter_1)
-
-if lang == "zh":
-  filter_1 = nonchinese_ratio_remove(filter_1)
-if lang=="ja":
-  filter_1 = nonjapanese_ratio_remove(filter_1)
-
-filter_1 = emoji_remove(filter_1)
-filter_1 = langid_remove(filter_1)
-
-
-fr_1.close()
-
-
-fw_1 = open(f1 + ".clean", "w", encoding="utf8")
-
-print('After all filtering rules, remain %i pairs' % len(filter_1))
-
-for x in filter_1:
-  print(x, file=fw_1)
-
-fw_1.close()
+import time
+
+from clean_rules import RuleChain, rules_version
+from pipeline import (load_pipeline, default_pipeline, build_rules, use_external_dedup, reorder_rules, overrides_from_args,
+                      insert_rule)
+from instrument import RuleStats, write_stats, profile_slowest
+from verdict_cache import VerdictCache
+from corpus import open_corpus
+from compressed import open_text, output_path
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('src', help='source file')
+  parser.add_argument('lang', help='language')
+  parser.add_argument('--pipeline', default=None, help='JSON/YAML file describing the rules, their order and thresholds, default pipelines/mono.json')
+  parser.add_argument('--reorder', type=int, default=None, metavar='N', help='measure the rejection rate of every rule on the first N lines and run cheap (by a fixed cost estimate), selective rules first, the same input always gives the same order, the kept sentences are the same but the per-rule counts may differ')
+  parser.add_argument('--soft_html', action=argparse.BooleanOptionalAction, default=None, help='strip html tags, urls and entities from the sentences (the default of the pipeline), --no-soft_html removes the sentences containing them instead')
+  parser.add_argument('--compress', choices=('gz', 'zst', 'none'), default=None, help='compress .clean with gzip (pigz when available) or multi-threaded zstd, default the format of the input file (.gz/.zst inputs are read transparently)')
+  parser.add_argument('--workers', type=int, default=1, help='number of processes used to run the filtering rules, output is identical to a single process run')
+  parser.add_argument('--near_dup', type=float, default=None, metavar='THRESHOLD', help='also remove sentences colliding with an earlier kept sentence in any band of their character n-gram MinHash signatures, the bands are chosen so that sentences with about this Jaccard similarity collide, e.g. 0.8; it is not an exact cutoff, a sentence with similarity s is removed with probability 1-(1-s^rows)^bands (printed in the log)')
+  parser.add_argument('--near_dup_bands', type=int, default=None, help='number of LSH bands of --near_dup instead of choosing them from THRESHOLD, more bands remove more sentences (higher recall)')
+  parser.add_argument('--near_dup_rows', type=int, default=None, help='number of MinHash values per LSH band of --near_dup, more rows remove fewer sentences (higher precision)')
+  parser.add_argument('--heldout', nargs='+', default=None, help='held-out files (e.g. valid/valid.raw.zh valid/valid.raw.ja and the test set), remove training sentences sharing a long character n-gram with them, the n-gram index is cached next to the first file')
+  parser.add_argument('--heldout_ngram', type=int, default=None, help='length of the character n-grams of --heldout, default 10')
+  parser.add_argument('--heldout_flag', action='store_true', default=False, help='only report how many sentences overlap the held-out files instead of removing them')
+  parser.add_argument('--external_dedup', action='store_true', default=False, help='for corpora larger than memory: find duplicated sentences with an extra pass that spills hashes to disk and sorts them there')
+  parser.add_argument('--tmp_dir', default=None, help='directory for the temporary files of --external_dedup')
+  parser.add_argument('--verdict_cache', default=None, help='sqlite file caching the verdict of every normalized sentence, a rerun only checks sentences that are not in it yet')
+  parser.add_argument('--langid_langs', nargs='+', default=None, help='only tell apart these languages (lang is always included), e.g. --langid_langs zh ja, instead of all 97 languages of langid')
+  parser.add_argument('--langid_threshold', type=float, default=None, help='reject a sentence whose language confidence among the candidate languages is below this value')
+  parser.add_argument('--langid_cache', type=int, default=None, help='number of language identification results kept in the LRU cache')
+  parser.add_argument('--langid_shortcut', action='store_true', default=False, help='treat japanese sentences with enough kana as japanese without running langid')
+  parser.add_argument('--stats', default=None, help='write per-rule wall time, lines in/out, rejection rate, lines/s and peak RSS delta to this file (.json or .csv)')
+  parser.add_argument('--profile', default=None, help='run every rule under cProfile for the first lines it receives and save the profile of the slowest rule to this file')
+  args = parser.parse_args()
+
+  f1 = args.src
+  lang = args.lang
+
+  # 规则、顺序和阈值见 pipelines/mono.json
+  spec = load_pipeline(args.pipeline) if args.pipeline else default_pipeline('mono')
+  spec.setdefault('langs', [lang])
+  if args.reorder is not None:
+    spec['reorder'] = args.reorder
+  if args.heldout:
+    insert_rule(spec, 'contamination_remove', heldout=args.heldout, ngram=args.heldout_ngram,
+                action='flag' if args.heldout_flag else None)
+  if args.near_dup is not None:
+    insert_rule(spec, 'near_dup_remove', threshold=args.near_dup, bands=args.near_dup_bands, rows=args.near_dup_rows)
+
+  # 输入文件映射到内存，按块解码 (见 corpus.py)，几遍扫描共用同一份页缓存和行索引；压缩文件每遍在后台重新解压
+  fr_1 = open_corpus(f1)
+
+  rules = build_rules(spec, 'mono', overrides=overrides_from_args(args))
+  if args.external_dedup:
+    # 先扫一遍语料找出所有重复行 (经过去重之前的规范化等规则)，去重表不占内存
+    rules = use_external_dedup(rules, ((x,) for x in fr_1), args.tmp_dir)
+  if spec.get('reorder'):
+    rules = reorder_rules(rules, ((x,) for x in fr_1.lines(0, spec['reorder'])))
+  cache = VerdictCache(args.verdict_cache, rules_version(rules), [rule.name for rule in rules]) if args.verdict_cache else None
+  stats = RuleStats(len(rules), 1000 if args.profile else 0) if args.stats or args.profile else None
+  chain = RuleChain(rules, cache=cache, stats=stats)
+  start = time.time()
+
+  filter_1 = [x for x, in chain.filter(((x,) for x in fr_1), args.workers)]
+
+  chain.report()
+
+  fr_1.close()
+
+  fw_1 = open_text(output_path(f1, ".clean", args.compress), "w")
+
+  print('After all filtering rules, remain %i pairs' % len(filter_1))
+
+  for x in filter_1:
+    print(x, file=fw_1)
+
+  fw_1.close()
+
+  if args.stats:
+    write_stats(chain, time.time() - start, args.stats)
+  if args.profile:
+    profile_slowest(chain, args.profile)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,420 +1,201 @@
 import sys
-import re
 import argparse
-from string import punctuation
-import langid
-import unicodedata
+import time
+from itertools import islice
 from tqdm import tqdm
 
-parser = argparse.ArgumentParser()
-parser.add_argument('src', help='source file')
-parser.add_argument('tgt', help='target file')
-parser.add_argument('--soft_html', action='store_true', default=False,
-                    help='whether to use soft version only to remove html tag, not the sentence')
-args = parser.parse_args()
-f1 = args.src
-f2 = args.tgt
-
-# 句子长度区间
-min_tok = 3
-max_top = 100
-
-# 符号数量和比例
-punc_max_num = 10
-
-
-# 预处理
-def norm(x_in, y_in):
-    x_out = []
-    y_out = []
-
-    for (x, y) in zip(x_in, y_in):
-        x = unicodedata.normalize('NFKC', x.strip()).replace(" ", "")
-        y = unicodedata.normalize('NFKC', y.strip()).replace(" ", "")
-        x = re.sub('[\u200D\uFEFF\u200b\u00AD\u202C\u202D\u200C\u202A\u200E\uFDD3]', '', x.strip(), flags=re.MULTILINE)
-        y = re.sub('[\u200D\uFEFF\u200b\u00AD\u202C\u202D\u200C\u202A\u200E\uFDD3]', '', y.strip(), flags=re.MULTILINE)
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After norm, remain %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉重复
-def dup_remove(x_in, y_in):
-    tok = 'wojiushicuihongyihaha'
-    all_lines = []
-    for x, y in zip(x_in, y_in):
-        all_lines.append(x.strip() + tok + y.strip())  # [src+tok+tgt]
-    all_lines = set(all_lines)  # make as set
-
-    x_out = []
-    y_out = []
-    for sent in all_lines:
-        segs = sent.split(tok)
-        x_out.append(segs[0])
-        y_out.append(segs[1])
-    assert len(x_out) == len(y_out)
-    print('After removing duplicated sentences, remain %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉soure和target一样的句子
-def src_tgt_same_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-    for (x, y) in zip(x_in, y_in):
-        if x.strip() == y.strip():
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing same source and target sentence, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# 去掉太长或者太短的句子
-def sentence_len_remove(x_in, y_in):
-    def check_word_num(sent):
-        segs = sent.strip()
-        if len(segs) < min_tok or len(segs) > max_top:
-            return False
-        return True
-
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    for (x, y) in zip(x_in, y_in):
-        if check_word_num(x) and check_word_num(y):
-            x_out.append(x.strip())
-            y_out.append(y.strip())
-        else:
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with too less or too many words, reamin %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# 去掉特定符号太多的句子
-def sp_punc_remove(x_in, y_in):
-    def hot_fix_filter(sent):
-        sent = sent.strip()
-        if sent.count("/") > 5:
-            return False
-        if sent.count("|") > 5:
-            return False
-        if sent.count("-") > 5:
-            return False
-        if len(re.findall("[\d\-\|/]", sent)) / len(sent) > 0.5:
-            return False
-        return True
-
-    x_out = []
-    y_out = []
-
-    for (x, y) in zip(x_in, y_in):
-        if hot_fix_filter(x) and hot_fix_filter(y):
-            x_out.append(x.strip())
-            y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with too many specific punctuations, reamin %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉有特殊字符的句子
-def sp_char_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-
-    for (x, y) in zip(x_in, y_in):
-        if r"\x" in x or r"\x" in y \
-                or u'\xa0' in x or u'\xa0' in y \
-                or u'\u3000' in x or u'\u3000' in y \
-                or '▅' in x or '▅' in y:
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with special characters, remain %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉符号不符合比例的句子
-def punc_ratio_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    count_func = lambda l1, l2: sum([1 for x in l1 if x in l2])
-
-    punctuation_set = set(punctuation)
-    for (x, y) in zip(x_in, y_in):
-        m_punc_x = count_func(x.strip(), set(punctuation_set))
-        m_punc_y = count_func(y.strip(), set(punctuation_set))
-        if m_punc_x / (len(x.strip()) + 1e-9) > 0.5 or m_punc_y / (
-                len(y.strip()) + 1e-9) > 0.5 or m_punc_x > punc_max_num or m_punc_y > punc_max_num:
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with too much punctuations, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# 去掉太多字母 太多数字的句子
-def numalp_ratio_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    for (x, y) in zip(x_in, y_in):
-        x = x.strip()
-        y = y.strip()
-        if re.findall(r"\d{8}", x) or re.findall(r"\d{8}", y) \
-                or re.findall(r"[A-Za-z0-9]{15}", x) or re.findall(r"[A-Za-z0-9]{15}", y) \
-                or len(re.findall(r"[A-Za-z0-9]{1}", x)) / len(x) > 0.5 or len(re.findall(r"[A-Za-z0-9]{1}", y)) / len(
-            y) > 0.5:
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with much numbers or alp, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-def st_numalp_ratio_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    for (x, y) in zip(x_in, y_in):
-        pm_x = len(re.findall(r"[A-Za-z0-9]", x.strip()))
-        pm_y = len(re.findall(r"[A-Za-z0-9]", y.strip()))
-        if pm_x / (pm_y + 1e-9) > 2 or pm_y / (pm_x + 1e-9) > 2:
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing unbalance source-target number&alp ratio, reamin %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# 去掉有网址的句子
-def html_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-
-    def filter_by_html(sentence):
-        sen = sentence.strip()
-        detector = re.compile('<.*?>')
-        html_tag = re.findall(detector, sen)
-        if html_tag or 'https://' in sen or 'http://' in sen:
-            return False
-        return True
-
-    def soft_filter_by_html(sent):
-        sent = sent.strip()
-        detector = re.compile('<.*?>')
-        sent = re.sub(detector, '', sent)
-        sent = re.sub('https?:\/\/.*[ \r\n]', '', x, flags=re.MULTILINE)
-        return sent
-
-    for (x, y) in zip(x_in, y_in):
-        if args.soft_html:
-            x_out.append(soft_filter_by_html(x))
-            y_out.append(soft_filter_by_html(y))
-        else:
-            if filter_by_html(x) or filter_by_html(y):
-                x_out.append(x.strip())
-                y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with html address or tags, remain %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉1111x1111
-def x_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-
-    for (x, y) in zip(x_in, y_in):
-        x = x.strip()
-        y = y.strip()
-        if re.findall(r"[0-9]{3,4}x[0-9]{3,4}", x) or re.findall(r"[0-9]{3,4}x[0-9]{3,4}", y):
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with 1111x1111, remain %i pairs' % len(x_out))
-    return x_out, y_out
-
-
-# 去掉中文太少的句子
-def nonzhja_ratio_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    for (x, y) in zip(x_in, y_in):
-        x = x.strip()
-        y = y.strip()
-        if len(re.findall("[\u4e00-\u9fa5]", x)) / len(x) < 0.5 or len(re.findall(u"[ぁ-んァ-ン一-龥]", y)) / len(y) < 0.5:
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with less chinese or japanese character, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# emoji
-def emoji_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-    emoj = re.compile("["
-                      u"\U0001F600-\U0001F64F"  # emoticons
-                      u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                      u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                      u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                      "]+", flags=re.UNICODE)
-
-    for (x, y) in zip(x_in, y_in):
-        x = x.strip()
-        y = y.strip()
-        if re.findall(emoj, x) or re.findall(emoj, y):
-            x_trash.append(x)
-            y_trash.append(y)
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with emoji, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-# 去掉语言不对的句子
-def langid_remove(x_in, y_in):
-    x_out = []
-    y_out = []
-    x_trash, y_trash = [], []
-
-    for (x, y) in tqdm(zip(x_in, y_in), mininterval=1.0, ncols=50):
-        x = x.strip()
-        y = y.strip()
-        if langid.classify(x)[0] != 'zh' or langid.classify(y)[0] != 'ja':
-            x_trash.append(x.strip())
-            y_trash.append(y.strip())
-            continue
-        x_out.append(x.strip())
-        y_out.append(y.strip())
-
-    assert len(x_out) == len(y_out)
-    print('After removing sentences with other language, remain %i pairs' % len(x_out))
-    return x_out, y_out, x_trash, y_trash
-
-
-def write_subfile(fn, x_trash, y_trash):
-    pass
-    # import os
-    # os.makedirs('tmp', exist_ok=True)
-    # fw_x = open(f'tmp/{fn}.zh', 'w')
-    # fw_y = open(f'tmp/{fn}.ja', 'w')
-    #
-    # for x, y in zip(x_trash, y_trash):
-    #     fw_x.write(f'{x.strip()}\n')
-    #     fw_y.write(f'{y.strip()}\n')
-    #
-    # fw_x.close()
-    # fw_y.close()
-
-filter_1 = []
-filter_2 = []
-filter_out_1, filter_out_2 = [], []
-
-fr_1 = open(f1, "r", encoding="utf8")
-fr_2 = open(f2, "r", encoding="utf8")
-
-f1_all_lines = fr_1.readlines()
-f2_all_lines = fr_2.readlines()
-
-filter_1, filter_2 = norm(f1_all_lines, f2_all_lines)
-filter_1, filter_2 = dup_remove(filter_1, filter_2)
-filter_1, filter_2, x_trash, y_trash = src_tgt_same_remove(filter_1, filter_2)
-# filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('src_tgt_same_remove', x_trash, y_trash)
-filter_1, filter_2, x_trash, y_trash = sentence_len_remove(filter_1, filter_2)
-filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('sentence_len_remove', x_trash, y_trash)
-filter_1, filter_2 = sp_punc_remove(filter_1, filter_2)
-filter_1, filter_2 = sp_char_remove(filter_1, filter_2)
-filter_1, filter_2, x_trash, y_trash = punc_ratio_remove(filter_1, filter_2)
-# filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('punc_ratio_remove', x_trash, y_trash)
-filter_1, filter_2, x_trash, y_trash = numalp_ratio_remove(filter_1, filter_2)
-filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('numalp_ratio_remove', x_trash, y_trash)
-filter_1, filter_2, x_trash, y_trash = st_numalp_ratio_remove(filter_1, filter_2)
-filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('st_numalp_ratio_remove', x_trash, y_trash)
-filter_1, filter_2 = html_remove(filter_1, filter_2)
-filter_1, filter_2 = x_remove(filter_1, filter_2)
-filter_1, filter_2, x_trash, y_trash = nonzhja_ratio_remove(filter_1, filter_2)
-# filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('nonzhja_ratio_remove', x_trash, y_trash)
-filter_1, filter_2, x_trash, y_trash = emoji_remove(filter_1, filter_2)
-filter_out_1.extend(x_trash), filter_out_2.extend(y_trash), write_subfile('emoji_remove', x_trash, y_trash)
-filter_1, filter_2, x_trash, y_trash = langid_remove(filter_1, filter_2)
-filter_out_1.extend(x_trash), filter_out_2.extend(y_trash)
-
-fr_1.close()
-fr_2.close()
-
-fw_1 = open(f1 + ".clean", "w", encoding="utf8")
-fw_2 = open(f2 + ".clean", "w", encoding="utf8")
-
-assert len(filter_1) == len(filter_2)
-print('After all filtering rules, remain %i pairs' % len(filter_1))
-
-for x in filter_1:
-    print(x, file=fw_1)
-
-for y in filter_2:
-    print(y, file=fw_2)
-
-fw_1.close()
-fw_2.close()
-
-fw_1 = open(f'{f1}.trash', 'a', encoding='utf-8')
-fw_2 = open(f'{f2}.trash', 'a', encoding='utf-8')
-
-assert len(filter_out_1) == len(filter_out_2)
-print(f'{len(filter_out_1)} pairs are put into trash bin, waiting for recycle.')
-
-for l1,l2 in zip(filter_out_1, filter_out_2):
-    fw_1.write(l1.strip() + '\n')
-    fw_2.write(l2.strip() + '\n')
-
-fw_1.close(), fw_2.close()
+from clean_rules import RuleChain, LangidRemove, rules_version
+from langid_stage import LangidScorer
+from pipeline import (load_pipeline, default_pipeline, build_rules, use_external_dedup, reorder_rules, overrides_from_args,
+                      insert_rule, resolved_pipeline, TRASH_RULES)
+from instrument import RuleStats, write_stats, profile_slowest
+from verdict_cache import VerdictCache
+from trash_bin import TrashBin
+from corpus import open_corpus, line_count
+from compressed import open_text, output_path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', help='source file')
+    parser.add_argument('tgt', help='target file')
+    parser.add_argument('--pipeline', default=None,
+                        help='JSON/YAML file describing the rules, their order and thresholds, default pipelines/pair.json')
+    parser.add_argument('--reorder', type=int, default=None, metavar='N',
+                        help='measure the rejection rate of every rule on the first N lines and run cheap (by a fixed cost estimate), selective rules first, the same input always gives the same order, the kept pairs are the same, the per-rule counts and the trash may differ')
+    parser.add_argument('--soft_html', action=argparse.BooleanOptionalAction, default=None,
+                        help='strip html tags, urls and entities from the sentences (the default of the pipeline), '
+                             '--no-soft_html removes the sentences containing them instead')
+    parser.add_argument('--stream', action='store_true', default=False,
+                        help='write .clean incrementally instead of keeping the kept pairs in memory '
+                             '(the input files are always memory-mapped, not loaded)')
+    parser.add_argument('--compress', choices=('gz', 'zst', 'none'), default=None,
+                        help='compress .clean and .trash with gzip (pigz when available) or multi-threaded zstd, '
+                             'default the format of the input files (.gz/.zst inputs are read transparently)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to run the filtering rules, output is identical to a single process run')
+    parser.add_argument('--near_dup', type=float, default=None, metavar='THRESHOLD',
+                        help='also remove pairs colliding with an earlier kept pair in any band of their character n-gram '
+                             'MinHash signatures, the bands are chosen so that pairs with about this Jaccard similarity collide, '
+                             'e.g. 0.8; it is not an exact cutoff, a pair with similarity s is removed with probability '
+                             '1-(1-s^rows)^bands (printed in the log)')
+    parser.add_argument('--near_dup_bands', type=int, default=None,
+                        help='number of LSH bands of --near_dup instead of choosing them from THRESHOLD, '
+                             'more bands remove more pairs (higher recall)')
+    parser.add_argument('--near_dup_rows', type=int, default=None,
+                        help='number of MinHash values per LSH band of --near_dup, more rows remove fewer pairs (higher precision)')
+    parser.add_argument('--near_dup_side', choices=('src', 'tgt', 'joined'), default=None,
+                        help='compare only the source, only the target or both sides joined (default) for --near_dup')
+    parser.add_argument('--heldout', nargs='+', default=None,
+                        help='held-out files (e.g. valid/valid.raw.zh valid/valid.raw.ja and the test set), remove training pairs '
+                             'sharing a long character n-gram with them, the n-gram index is cached next to the first file')
+    parser.add_argument('--heldout_ngram', type=int, default=None, help='length of the character n-grams of --heldout, default 10')
+    parser.add_argument('--heldout_flag', action='store_true', default=False,
+                        help='only report how many pairs overlap the held-out files instead of removing them')
+    parser.add_argument('--external_dedup', action='store_true', default=False,
+                        help='for corpora larger than memory: find duplicated pairs with an extra pass '
+                             'that spills hashes to disk and sorts them there')
+    parser.add_argument('--tmp_dir', default=None, help='directory for the temporary files of --external_dedup')
+    parser.add_argument('--verdict_cache', default=None,
+                        help='sqlite file caching the verdict of every normalized pair, a rerun only checks pairs that are not in it yet')
+    parser.add_argument('--langid_langs', nargs='+', default=None,
+                        help='only tell apart these languages (the languages of both sides are always included), e.g. --langid_langs zh ja, instead of all 97 languages of langid')
+    parser.add_argument('--langid_threshold', type=float, default=None,
+                        help='reject a sentence whose language confidence among the candidate languages is below this value')
+    parser.add_argument('--trash_scores', action='store_true', default=False,
+                        help='also write the language and its confidence of every trashed sentence to .trash.score, '
+                             'one line per line of .trash')
+    parser.add_argument('--trash_bin', default=None,
+                        help='TSV file recording the line number, the rejecting rule and the pair of every trashed pair, '
+                             'with an index for extracting the pairs of one rule (see trash_bin.py), default <src>.trash.tsv')
+    parser.add_argument('--langid_cache', type=int, default=None,
+                        help='number of language identification results kept in the LRU cache')
+    parser.add_argument('--langid_shortcut', action='store_true', default=False,
+                        help='treat japanese sentences with enough kana as japanese without running langid')
+    parser.add_argument('--stats', default=None,
+                        help='write per-rule wall time, lines in/out, rejection rate, lines/s and peak RSS delta to this file (.json or .csv)')
+    parser.add_argument('--profile', default=None,
+                        help='run every rule under cProfile for the first lines it receives and save the profile of the slowest rule to this file')
+    args = parser.parse_args()
+    f1 = args.src
+    f2 = args.tgt
+
+    # 规则、顺序和阈值 (句子长度区间、符号数量和比例等) 见 pipelines/pair.json
+    spec = load_pipeline(args.pipeline) if args.pipeline else default_pipeline('pair')
+    if args.reorder is not None:
+        spec['reorder'] = args.reorder
+    if args.heldout:
+        insert_rule(spec, 'contamination_remove', heldout=args.heldout, ngram=args.heldout_ngram,
+                    action='flag' if args.heldout_flag else None)
+    if args.near_dup is not None:
+        insert_rule(spec, 'near_dup_remove', threshold=args.near_dup, side=args.near_dup_side, bands=args.near_dup_bands,
+                    rows=args.near_dup_rows)
+
+    # 输入文件映射到内存，按块解码 (见 corpus.py)，几遍扫描共用同一份页缓存和行索引；压缩文件每遍在后台重新解压
+    fr_1 = open_corpus(f1)
+    fr_2 = open_corpus(f2)
+
+    rules = build_rules(spec, 'pair', overrides=overrides_from_args(args))
+    if args.external_dedup:
+        # 先扫一遍语料找出所有重复行 (经过去重之前的规范化等规则)，去重表不占内存
+        rules = use_external_dedup(rules, zip(fr_1, fr_2), args.tmp_dir)
+    if spec.get('reorder'):
+        rules = reorder_rules(rules, islice(zip(fr_1, fr_2), spec['reorder']))
+    for rule in rules:
+        rule.trash = rule.name in TRASH_RULES
+    if args.trash_scores:
+        langid_rule = next((rule for rule in rules if isinstance(rule, LangidRemove)), None)
+        scorer = langid_rule.scorer if langid_rule is not None else LangidScorer()
+    cache = VerdictCache(args.verdict_cache, rules_version(rules), [rule.name for rule in rules]) if args.verdict_cache else None
+    stats = RuleStats(len(rules), 1000 if args.profile else 0) if args.stats or args.profile else None
+
+    start = time.time()
+
+    # 垃圾句子对在过滤的同时写出: .trash 追加，带行号和规则的垃圾箱 (见 trash_bin.py) 每次重写
+    ft_1 = open_text(output_path(f1, '.trash', args.compress), 'a')
+    ft_2 = open_text(output_path(f2, '.trash', args.compress), 'a')
+    # 垃圾箱记下实际执行的规则顺序和参数，回收时按它重建规则
+    trash_bin = TrashBin(args.trash_bin or output_path(f1, '.trash.tsv', 'none'), [rule.name for rule in rules if rule.trash],
+                         resolved_pipeline(spec, rules))
+    if args.trash_scores:
+        fs_1 = open(output_path(f1, '.trash.score', 'none'), 'a', encoding='utf-8', buffering=1 << 20)
+        fs_2 = open(output_path(f2, '.trash.score', 'none'), 'a', encoding='utf-8', buffering=1 << 20)
+        pending = []
+
+    def write_scores():
+        # 每个垃圾句子对在 .trash.score 里对应一行 "语种<TAB>置信度"，与 .trash 逐行对齐；攒够一批再识别
+        for fs, sents in ((fs_1, [x for x, _ in pending]), (fs_2, [y for _, y in pending])):
+            for lang, p in scorer.predict(sents):
+                fs.write('%s\t%.4f\n' % (lang, p))
+        pending.clear()
+
+    def write_trash(sents, i, line):
+        ft_1.write(sents[0] + '\n')
+        ft_2.write(sents[1] + '\n')
+        trash_bin.write(line, rules[i].name, sents)
+        if args.trash_scores:
+            pending.append(sents)
+            if len(pending) >= scorer.batch_size:
+                write_scores()
+
+    chain = RuleChain(rules, on_trash=write_trash, cache=cache, stats=stats)
+    total = line_count(fr_1, fr_2)
+
+    if args.stream:
+        # .clean 也边过滤边写出
+        fw_1 = open_text(output_path(f1, ".clean", args.compress), "w")
+        fw_2 = open_text(output_path(f2, ".clean", args.compress), "w")
+        for x, y in chain.filter(tqdm(zip(fr_1, fr_2), total=total, mininterval=1.0, ncols=50), args.workers):
+            fw_1.write(x + '\n')
+            fw_2.write(y + '\n')
+
+        fw_1.close(), fw_2.close()
+        chain.report()
+        print('After all filtering rules, remain %i pairs' % chain.remain)
+
+    else:
+        filter_1 = []
+        filter_2 = []
+
+        for x, y in chain.filter(tqdm(zip(fr_1, fr_2), total=total, mininterval=1.0, ncols=50), args.workers):
+            filter_1.append(x)
+            filter_2.append(y)
+
+        chain.report()
+
+        fw_1 = open_text(output_path(f1, ".clean", args.compress), "w")
+        fw_2 = open_text(output_path(f2, ".clean", args.compress), "w")
+
+        assert len(filter_1) == len(filter_2)
+        print('After all filtering rules, remain %i pairs' % len(filter_1))
+
+        for x in filter_1:
+            print(x, file=fw_1)
+
+        for y in filter_2:
+            print(y, file=fw_2)
+
+        fw_1.close()
+        fw_2.close()
+
+    ft_1.close(), ft_2.close()
+    trash_bin.close()
+    if args.trash_scores:
+        write_scores()
+        fs_1.close(), fs_2.close()
+    print(f'{trash_bin.count} pairs are put into trash bin, waiting for recycle.')
+
+    fr_1.close()
+    fr_2.close()
+
+    if args.stats:
+        write_stats(chain, time.time() - start, args.stats)
+    if args.profile:
+        profile_slowest(chain, args.profile)
+
+
+if __name__ == '__main__':
+    main()
+
 
 # def sbcdbc(x_in, y_in):
 #   x_out = []
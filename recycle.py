@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 回收垃圾箱: 放宽阈值后不必重跑整个语料，只重新检查 preprocess_with_trash.py 写下的垃圾箱 (<src>.trash.tsv)。
+#
+# 规则默认按垃圾箱索引里记下的流程重建: 写入时实际执行的顺序 (--reorder 调整过的顺序) 和参数
+# (含 --langid_langs、--heldout、--no-soft_html 等命令行设置)，再用 --set 修改阈值；给出 --pipeline 时改用它。
+# 垃圾箱里记录的是过滤掉它的规则的输入 (已经规范化、去重)，每个句子对用新的阈值重跑所有无状态规则
+# (规范化等改写句子的规则再跑一遍结果不变)，判定和用新阈值重跑整个语料相同，即使 --set 收紧了排在前面的规则。
+# 重新通过的句子对追加到 .clean 的末尾，已经在 .clean 里的句子不动；
+# 仍被垃圾箱规则过滤掉的句子对按新的原因写回垃圾箱，被其它规则过滤掉的直接丢弃。
+# 有状态的规则 (去重) 不再执行: 垃圾箱里的句子对在去重之后才被过滤，彼此以及和 .clean 都不重复。
+# .trash 和 .trash.score 保持原样。
+#
+#   python recycle.py c.zh c.ja --set sentence_len_remove.max_tok=150 --set numalp_ratio_remove.max_ratio=0.6
+#   python recycle.py c.zh c.ja --pipeline relaxed.json
+
+import argparse
+import json
+import os
+from collections import Counter, defaultdict
+
+from clean_rules import chunked, run_rules
+from pipeline import load_pipeline, default_pipeline, build_rules, resolved_pipeline, TRASH_RULES
+from trash_bin import TrashBin, iter_records, read_header
+from compressed import open_text, output_path
+
+
+def parse_overrides(items):
+    # rule.param=value，value 按 JSON 解析，解析不了时当作字符串
+    overrides = defaultdict(dict)
+    for item in items or []:
+        key, value = item.split('=', 1)
+        rule, param = key.split('.', 1)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        overrides[rule][param] = value
+    return dict(overrides)
+
+
+def recycle(records, rules, chunk_size=10000):
+    # records: [(行号, 规则名, 句子组)]，返回对应的 [(拒绝它的规则下标或 None, 句子组)]
+    stateless = [(i, rule) for i, rule in enumerate(rules) if not rule.stateful]
+    verdicts = []
+    for chunk in chunked(records, chunk_size):
+        verdicts.extend(run_rules(stateless, [sents for _, _, sents in chunk]))
+    return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', help='source file, <src>.clean gets the recovered pairs')
+    parser.add_argument('tgt', help='target file, <tgt>.clean gets the recovered pairs')
+    parser.add_argument('--trash_bin', default=None, help='trash bin TSV to recycle, default <src>.trash.tsv')
+    parser.add_argument('--pipeline', default=None,
+                        help='JSON/YAML file with the relaxed rules and thresholds, default the rules, order and options '
+                             'recorded in the trash bin by preprocess_with_trash.py (pipelines/pair.json for older trash bins)')
+    parser.add_argument('--compress', choices=('gz', 'zst', 'none'), default=None,
+                        help='compression of .clean as given to preprocess_with_trash.py, default the format of the input files')
+    parser.add_argument('--set', action='append', default=None, metavar='RULE.PARAM=VALUE',
+                        help='override one parameter of a rule, e.g. --set sentence_len_remove.max_tok=150, can be repeated')
+    args = parser.parse_args()
+    f1, f2 = args.src, args.tgt
+    path = args.trash_bin or output_path(f1, '.trash.tsv', 'none')
+
+    if args.pipeline:
+        spec = load_pipeline(args.pipeline)
+    else:
+        spec = read_header(path)['pipeline'] or default_pipeline('pair')
+    rules = build_rules(spec, 'pair', overrides=parse_overrides(args.set))
+    records = list(iter_records(path))
+    verdicts = recycle(records, rules)
+
+    recovered = Counter()
+    # 先写到临时文件再替换，中途出错时原来的垃圾箱还在
+    trash_bin = TrashBin(path + '.tmp', [rule.name for rule in rules if rule.name in TRASH_RULES], resolved_pipeline(spec, rules))
+    # 压缩的 .clean 在末尾追加一个新的压缩帧
+    with open_text(output_path(f1, '.clean', args.compress), 'a') as fw_1, \
+            open_text(output_path(f2, '.clean', args.compress), 'a') as fw_2:
+        for (line, name, _), (idx, sents) in zip(records, verdicts):
+            if idx is None:
+                recovered[name] += 1
+                fw_1.write(sents[0] + '\n')
+                fw_2.write(sents[1] + '\n')
+            elif rules[idx].name in TRASH_RULES:
+                trash_bin.write(line, rules[idx].name, sents)
+    trash_bin.close()
+    os.replace(path + '.tmp', path)
+    os.replace(path + '.tmp.idx', path + '.idx')
+
+    for name, n in recovered.most_common():
+        print('Recovered %i pairs trashed by %s' % (n, name))
+    print('%i of %i pairs are recovered into .clean, %i pairs remain in trash bin.'
+          % (sum(recovered.values()), len(records), trash_bin.count))
+
+
+if __name__ == '__main__':
+    main()
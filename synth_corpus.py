@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 合成中日平行语料，用于清洗脚本的基准测试。
+#
+# 以 valid/valid.raw.zh 和 valid/valid.raw.ja 中的句子对为种子随机抽取，再按给定比例加入各种噪声，
+# 让每条清洗规则都有句子可以过滤。同样的 --seed 和参数总是生成同样的语料。
+#
+#   python synth_corpus.py bench_data/1M --lines 1M --noise html=0.05,dup=0.4
+#   => bench_data/1M.zh bench_data/1M.ja
+
+import argparse
+import random
+
+# 每一侧的噪声
+SIDE_NOISE = {
+    'html': lambda r, s: r.choice(['<b>{}</b>', '<a href="/x">{}</a>', '{}<br>']).format(s),
+    'url': lambda r, s: '%s http://example.com/%i ' % (s, r.randrange(1000)),
+    'emoji': lambda r, s: s + r.choice('😀😂🚀🇯🇵'),
+    'digits': lambda r, s: r.choice(['{}%i' % r.randrange(10 ** 8, 10 ** 9), '1920x1080{}', '{}abcdefghijklmnopq']).format(s),
+    'punct': lambda r, s: s + r.choice(['!!!!!!!!!!!!', '//////', '-|-|-|-|-|-|']),
+    'length': lambda r, s: r.choice([s[:1], s * 8]),
+    'space': lambda r, s: r.choice([' \u200b{}\u3000', '  {}  ', 'ＡＢＣ{}', '{}\xa0']).format(s),
+}
+
+# 整个句子对的噪声: 重复之前的句子对、语言不对、两侧相同
+PAIR_NOISE = ('dup', 'wrong_lang', 'same')
+
+DEFAULT_NOISE = dict(html=0.03, url=0.03, emoji=0.03, digits=0.03, punct=0.03, length=0.03, space=0.03,
+                     dup=0.3, wrong_lang=0.03, same=0.02)
+
+ENGLISH = ('the quick brown fox jumps over the lazy dog and this is an english sentence '
+           'that should not be in a chinese or japanese corpus').split()
+
+
+def parse_size(text):
+    # 10K / 1M / 10M 或者直接写数字
+    units = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1:].upper()])
+    return int(text)
+
+
+def parse_noise(text):
+    noise = dict(DEFAULT_NOISE)
+    for item in filter(None, (text or '').split(',')):
+        name, rate = item.split('=')
+        if name not in SIDE_NOISE and name not in PAIR_NOISE:
+            raise ValueError('unknown noise: %s' % name)
+        noise[name] = float(rate)
+    return noise
+
+
+def load_seed_pairs(src, tgt):
+    with open(src, encoding='utf8') as f1, open(tgt, encoding='utf8') as f2:
+        return [(x.rstrip('\n'), y.rstrip('\n')) for x, y in zip(f1, f2)]
+
+
+def generate(pairs, lines, noise, seed=1):
+    r = random.Random(seed)
+    emitted = []
+    for _ in range(lines):
+        if emitted and r.random() < noise['dup']:
+            x, y = r.choice(emitted)
+            yield x, y
+            continue
+        x, y = r.choice(pairs)
+        for name, fn in SIDE_NOISE.items():
+            if r.random() < noise[name]:
+                x = fn(r, x)
+            if r.random() < noise[name]:
+                y = fn(r, y)
+        if r.random() < noise['wrong_lang']:
+            wrong = r.choice([' '.join(r.choice(ENGLISH) for _ in range(r.randint(4, 12))), r.choice(pairs)[1]])
+            if r.random() < 0.5:
+                x = wrong
+            else:
+                y = wrong
+        if r.random() < noise['same']:
+            y = x
+        # 只保留有限个候选，供之后的重复使用
+        if len(emitted) < 100000:
+            emitted.append((x, y))
+        else:
+            emitted[r.randrange(len(emitted))] = (x, y)
+        yield x, y
+
+
+def write_corpus(prefix, pairs, lines, noise, seed=1):
+    with open(prefix + '.zh', 'w', encoding='utf8', buffering=1 << 20) as f1, \
+            open(prefix + '.ja', 'w', encoding='utf8', buffering=1 << 20) as f2:
+        for x, y in generate(pairs, lines, noise, seed):
+            f1.write(x + '\n')
+            f2.write(y + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('prefix', help='write <prefix>.zh and <prefix>.ja')
+    parser.add_argument('--lines', default='10K', help='number of pairs, e.g. 10K, 1M, 10M')
+    parser.add_argument('--noise', default=None,
+                        help='comma separated name=rate overriding the default noise mix, names: %s'
+                             % ', '.join(list(SIDE_NOISE) + list(PAIR_NOISE)))
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--src', default='valid/valid.raw.zh', help='seed source file')
+    parser.add_argument('--tgt', default='valid/valid.raw.ja', help='seed target file')
+    args = parser.parse_args()
+
+    write_corpus(args.prefix, load_seed_pairs(args.src, args.tgt), parse_size(args.lines), parse_noise(args.noise),
+                 args.seed)
+
+
+if __name__ == '__main__':
+    main()
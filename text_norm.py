@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 句子的规范化 (Norm 规则): NFKC，去掉空格和零宽字符，去掉首尾空白。结果与原先的实现逐字节相同:
+#
+#   x = unicodedata.normalize('NFKC', x.strip()).replace(" ", "")
+#   x = ZERO_WIDTH_RE.sub('', x.strip())
+#   return x.strip()
+#
+# 语料里绝大多数句子本来就是 NFKC 的，is_normalized 很快就能确认；其余的大多只含全角字母数字、半角片假名、
+# 全角空格这类逐字符的兼容映射，先用一张 str.translate 表把每个字符换成它自己的 NFKC 结果，通常就已经是 NFKC 了，
+# 只有仍然不是时 (组合字符等) 才调用 normalize。
+# 把字符换成它的 NFKC 结果不改变整个字符串的 NFKD 分解，所以最终结果与直接 normalize 相同。
+# 空格和零宽字符必须在 NFKC 之后删除: 删掉它们可能让两侧的字符组合起来 (如 ｶ 和 ﾞ 之间的零宽空格)。
+
+import re
+import unicodedata
+
+ZERO_WIDTH_RE = re.compile('[\u200D\uFEFF\u200b\u00AD\u202C\u202D\u200C\u202A\u200E\uFDD3]')
+
+
+def build_nfkc_table():
+    # 基本多文种平面内 NFKC 结果与自身不同的字符 -> 它的 NFKC 结果
+    table = {}
+    for c in range(0x10000):
+        if 0xD800 <= c < 0xE000:
+            continue
+        ch = chr(c)
+        out = unicodedata.normalize('NFKC', ch)
+        if out != ch:
+            table[c] = out
+    return table
+
+
+NFKC_TABLE = build_nfkc_table()
+
+
+def nfkc(x):
+    if unicodedata.is_normalized('NFKC', x):
+        return x
+    x = x.translate(NFKC_TABLE)
+    if unicodedata.is_normalized('NFKC', x):
+        return x
+    return unicodedata.normalize('NFKC', x)
+
+
+def norm(x):
+    return ZERO_WIDTH_RE.sub('', nfkc(x.strip()).replace(' ', '')).strip()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 带过滤原因的垃圾箱: 被过滤掉的句子组边过滤边追加到一个 TSV 文件，每行一条记录
+#   行号<TAB>规则名<TAB>第一侧<TAB>第二侧...
+# 行号是输入文件中的行号 (从 1 开始)，规则名即流程里的名字 (见 pipeline.py)；句子中的 \ 和 TAB 转义为 \\ 和 \t。
+#
+# 同时写一个索引 <TSV>.idx: 第一行是 JSON 的头部 {"rules": 规则名列表, "pipeline": 写入时实际执行的流程}，
+# 之后是每条记录定长 12 字节的 (规则序号 uint32, 字节偏移 uint64)，
+# 取出某条规则的垃圾句子组时只读索引，再按偏移逐条读取，不必扫描整个 TSV。
+# pipeline 是规则的执行顺序和参数 (含命令行给出的语种识别、留出集等设置，见 pipeline.resolved_pipeline)，
+# 回收时据此重建规则 (见 recycle.py)；旧版本的索引第一行只有规则名列表，没有 pipeline。
+#
+#   python trash_bin.py c.zh.trash.tsv                                      # 每条规则的垃圾数量
+#   python trash_bin.py c.zh.trash.tsv --rule langid_remove                 # 打印这条规则的记录
+#   python trash_bin.py c.zh.trash.tsv --rule langid_remove --out x.zh x.ja # 按侧写出句子
+
+import argparse
+import json
+import re
+import struct
+import sys
+
+import numpy as np
+
+RECORD = struct.Struct('<IQ')
+INDEX_DTYPE = np.dtype([('rule', '<u4'), ('offset', '<u8')])
+
+UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def escape(sent):
+    if '\\' in sent or '\t' in sent:
+        return sent.replace('\\', '\\\\').replace('\t', '\\t')
+    return sent
+
+
+def unescape(field):
+    if '\\' in field:
+        return UNESCAPE_RE.sub(lambda m: '\t' if m.group(1) == 't' else m.group(1), field)
+    return field
+
+
+class TrashBin(object):
+
+    # names: 可能出现的规则名，决定索引里的规则序号；pipeline: 写入时实际执行的流程，记在索引的头部
+    def __init__(self, path, names, pipeline=None):
+        self.path = path
+        self.names = list(dict.fromkeys(names))
+        self.codes = {name: i for i, name in enumerate(self.names)}
+        self.f = open(path, 'wb', buffering=1 << 20)
+        self.index = open(path + '.idx', 'wb', buffering=1 << 16)
+        header = {'rules': self.names, 'pipeline': pipeline}
+        self.index.write(json.dumps(header, ensure_ascii=False).encode('utf8') + b'\n')
+        self.offset = 0
+        self.count = 0
+
+    def write(self, line, rule, sents):
+        record = ('%i\t%s\t%s\n' % (line, rule, '\t'.join(escape(sent) for sent in sents))).encode('utf8')
+        self.index.write(RECORD.pack(self.codes[rule], self.offset))
+        self.f.write(record)
+        self.offset += len(record)
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+        self.index.close()
+
+
+def parse_record(record):
+    line, rule, *sents = record.decode('utf8').rstrip('\n').split('\t')
+    return int(line), rule, tuple(unescape(sent) for sent in sents)
+
+
+def parse_header(line):
+    # 索引的第一行，旧版本只有规则名列表
+    header = json.loads(line)
+    return header if isinstance(header, dict) else {'rules': header, 'pipeline': None}
+
+
+def read_header(path):
+    with open(path + '.idx', 'rb') as f:
+        return parse_header(f.readline())
+
+
+def read_index(path):
+    # 返回 (规则名列表, 每条记录的 (规则序号, 偏移) 数组)
+    with open(path + '.idx', 'rb') as f:
+        names = parse_header(f.readline())['rules']
+        return names, np.fromfile(f, dtype=INDEX_DTYPE)
+
+
+def counts(path):
+    names, index = read_index(path)
+    n = np.bincount(index['rule'], minlength=len(names))
+    return {name: int(c) for name, c in zip(names, n) if c}
+
+
+def iter_records(path, rule=None):
+    # 按写入顺序给出 (行号, 规则名, 句子组)；给出 rule 时只读这条规则的记录
+    names, index = read_index(path)
+    if rule is None:
+        offsets = index['offset']
+    elif rule in names:
+        offsets = index['offset'][index['rule'] == names.index(rule)]
+    else:
+        return
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(int(offset))
+            yield parse_record(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='trash bin TSV written by preprocess_with_trash.py')
+    parser.add_argument('--rule', default=None, help='only extract the pairs rejected by this rule')
+    parser.add_argument('--out', nargs='+', default=None,
+                        help='write the sentences of every side to these files instead of printing the records')
+    args = parser.parse_args()
+
+    if args.rule is None and args.out is None:
+        for name, n in counts(args.path).items():
+            print('%s\t%i' % (name, n))
+        return
+    if args.out is None:
+        for line, rule, sents in iter_records(args.path, args.rule):
+            sys.stdout.write('%i\t%s\t%s\n' % (line, rule, '\t'.join(escape(sent) for sent in sents)))
+        return
+    outs = [open(path, 'w', encoding='utf8', buffering=1 << 20) for path in args.out]
+    for _, _, sents in iter_records(args.path, args.rule):
+        for f, sent in zip(outs, sents):
+            f.write(sent + '\n')
+    for f in outs:
+        f.close()
+
+
+if __name__ == '__main__':
+    main()
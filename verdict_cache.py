@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+# 持久化的判定缓存: 语料每天只增长一点时，重跑只需检查新出现的句子对。
+#
+# 以 (规则配置版本, 规范化后的句子对) 的 128 位哈希为键，记录拒绝它的规则名 (通过为 NULL)，
+# 以及规则改写过句子时的结果。存放在 sqlite 里，配置一变键也跟着变，旧的记录不会被误用。
+# 记规则名而不是规则在链中的下标，调用方按自己的规则顺序换算成下标。
+
+import sqlite3
+
+from dedup import pair_key
+
+
+class VerdictCache(object):
+
+    # names: 规则链中每条规则的名字，判定里的规则下标按它换算
+    def __init__(self, path, version, names, batch_size=500):
+        self.version = version
+        self.names = list(names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS verdicts (key BLOB PRIMARY KEY, rule TEXT, out TEXT) WITHOUT ROWID')
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sents):
+        return pair_key((self.version,) + tuple(sents), 16).to_bytes(16, 'little')
+
+    def get(self, keys):
+        # 返回 {键: (拒绝的规则下标或 None, 句子组或 None)}，句子组为 None 表示与输入相同
+        found = {}
+        keys = list(set(keys))
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            rows = self.db.execute('SELECT key, rule, out FROM verdicts WHERE key IN (%s)' % ','.join('?' * len(batch)),
+                                   batch)
+            for key, rule, out in rows:
+                found[key] = (None if rule is None else self.positions[rule], None if out is None else tuple(out.split('\n')))
+        return found
+
+    def put(self, records):
+        # records: [(键, 输入的句子组, (拒绝的规则下标或 None, 输出的句子组))]
+        self.db.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)', [
+            (key, None if idx is None else self.names[idx], None if tuple(out) == tuple(sents) else '\n'.join(out))
+            for key, sents, (idx, out) in records])
+        self.db.commit()
+
+    def lookup(self, chunk):
+        # 返回 (每个句子组的键, 已缓存的判定 {位置: 判定}, 需要重新检查的位置)
+        keys = [self.key(sents) for sents in chunk]
+        found = self.get(keys)
+        cached, todo = {}, []
+        for p, (key, sents) in enumerate(zip(keys, chunk)):
+            if key in found:
+                idx, out = found[key]
+                cached[p] = (idx, sents if out is None else out)
+            else:
+                todo.append(p)
+        self.hits += len(cached)
+        self.misses += len(todo)
+        return keys, cached, todo
+
+    def close(self):
+        self.db.close()